@@ -2,6 +2,14 @@
 Class ADRS, stock address from sphincs
 """
 
+import struct
+
+_WORD = struct.Struct('>I')
+_TREE_ADDRESS = struct.Struct('>IQ')
+_TYPE_WORDS = struct.Struct('>IIII')
+_WORDS = struct.Struct('>III')
+_LOW_TREE_ADDRESS = struct.Struct('>Q')
+
 
 class ADRS:
     # TYPES
@@ -11,77 +19,94 @@ class ADRS:
     FORS_TREE = 3
     FORS_ROOTS = 4
 
-    def __init__(self):
-        self.layer = 0
-        self.tree_address = 0
+    # Byte size of the full and compressed (ADRSc, for SHA-2 instantiations) encodings
+    SIZE = 32
+    COMPRESSED_SIZE = 22
 
-        self.type = 0
+    __slots__ = ('_data', '_view', '_compressed', '_compressed_view')
+
+    def __init__(self):
+        # layer (4 bytes) || tree address (12 bytes) || type (4 bytes) || 3 words (4 bytes each)
+        # Words role can change depending on ADRS.type
+        self._data = bytearray(ADRS.SIZE)
+        self._view = memoryview(self._data)
 
-        # Words for which role can change depending on ADRS.type
-        self.word_1 = 0
-        self.word_2 = 0
-        self.word_3 = 0
+        # layer (1 byte) || tree address (8 bytes) || type (1 byte) || 3 words (4 bytes each)
+        self._compressed = bytearray(ADRS.COMPRESSED_SIZE)
+        self._compressed_view = memoryview(self._compressed)
 
     def copy(self):
-        adrs = ADRS()
-        adrs.layer = self.layer
-        adrs.tree_address = self.tree_address
-
-        adrs.type = self.type
-        adrs.word_1 = self.word_1
-        adrs.word_2 = self.word_2
-        adrs.word_3 = self.word_3
+        adrs = ADRS.__new__(ADRS)
+        adrs._data = bytearray(self._data)
+        adrs._view = memoryview(adrs._data)
+        adrs._compressed = bytearray(self._compressed)
+        adrs._compressed_view = memoryview(adrs._compressed)
         return adrs
 
     def to_bin(self):
-        adrs = self.layer.to_bytes(4, byteorder='big')
-        adrs += self.tree_address.to_bytes(12, byteorder='big')
+        """
+        Live view of the 32-byte encoding, it follows every later change of the address
+        """
+        return self._view
 
-        adrs += self.type.to_bytes(4, byteorder='big')
-        adrs += self.word_1.to_bytes(4, byteorder='big')
-        adrs += self.word_2.to_bytes(4, byteorder='big')
-        adrs += self.word_3.to_bytes(4, byteorder='big')
-
-        return adrs
+    def to_bin_compressed(self):
+        """
+        Live view of the 22-byte compressed encoding ADRSc used by SHA-2 instantiations
+        """
+        return self._compressed_view
 
     def reset_words(self):
-        self.word_1 = 0
-        self.word_2 = 0
-        self.word_3 = 0
+        _WORDS.pack_into(self._data, 20, 0, 0, 0)
+        _WORDS.pack_into(self._compressed, 10, 0, 0, 0)
 
     def set_type(self, val):
-        self.type = val
+        _TYPE_WORDS.pack_into(self._data, 16, val, 0, 0, 0)
+        self._compressed[9] = val
+        _WORDS.pack_into(self._compressed, 10, 0, 0, 0)
 
-        self.word_2 = 0
-        self.word_3 = 0
-        self.word_1 = 0
+    def get_type(self):
+        return _WORD.unpack_from(self._data, 16)[0]
 
     def set_layer_address(self, val):
-        self.layer = val
+        _WORD.pack_into(self._data, 0, val)
+        self._compressed[0] = val & 0xFF  # toByte(layer, 1)
+
+    def get_layer_address(self):
+        return _WORD.unpack_from(self._data, 0)[0]
 
     def set_tree_address(self, val):
-        self.tree_address = val
+        _TREE_ADDRESS.pack_into(self._data, 4, val >> 64, val & 0xFFFFFFFFFFFFFFFF)
+        _LOW_TREE_ADDRESS.pack_into(self._compressed, 1, val & 0xFFFFFFFFFFFFFFFF)
+
+    def get_tree_address(self):
+        high, low = _TREE_ADDRESS.unpack_from(self._data, 4)
+        return (high << 64) | low
 
     def set_key_pair_address(self, val):
-        self.word_1 = val
+        _WORD.pack_into(self._data, 20, val)
+        _WORD.pack_into(self._compressed, 10, val)
 
     def get_key_pair_address(self):
-        return self.word_1
+        return _WORD.unpack_from(self._data, 20)[0]
 
     def set_chain_address(self, val):
-        self.word_2 = val
+        _WORD.pack_into(self._data, 24, val)
+        _WORD.pack_into(self._compressed, 14, val)
 
     def set_hash_address(self, val):
-        self.word_3 = val
+        _WORD.pack_into(self._data, 28, val)
+        _WORD.pack_into(self._compressed, 18, val)
 
     def set_tree_height(self, val):
-        self.word_2 = val
+        _WORD.pack_into(self._data, 24, val)
+        _WORD.pack_into(self._compressed, 14, val)
 
     def get_tree_height(self):
-        return self.word_2
+        return _WORD.unpack_from(self._data, 24)[0]
 
     def set_tree_index(self, val):
-        self.word_3 = val
+        _WORD.pack_into(self._data, 28, val)
+        _WORD.pack_into(self._compressed, 18, val)
 
     def get_tree_index(self):
-        return self.word_3
+        return _WORD.unpack_from(self._data, 28)[0]
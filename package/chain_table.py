@@ -0,0 +1,139 @@
+"""
+Class ChainTable, every value of the WOTS+ chains of one XMSS subtree
+"""
+
+import os
+import mmap
+import struct
+import hashlib
+
+# magic, version, n, w, h, d, legacy PRF, len_0, layer, tree address, hash suite name
+_HEADER = struct.Struct('>8sHHHHHBHIQ16s')
+
+
+class ChainTable:
+    """
+    Value at position p of chain c of leaf i is the n bytes at ((i * len_0 + c) * w + p) * n of the buffer,
+    position 0 being the WOTS+ secret value and position w - 1 the end hashed into the leaf public key.
+
+    Saved files start with a page holding the header: fields of _HEADER || PK.seed || PK.root || SHA-256 of
+    everything before. They hold secret values and are only readable by their owner
+    """
+
+    MAGIC = b'SPXCHAIN'
+    VERSION = 1
+    PAGE = 4096
+
+    def __init__(self, public_key, params, suite_name, len_0, layer, tree, buffer=None):
+        """
+        :param public_key: PK.seed || PK.root of the key
+        :param params: (n, w, h, d, legacy PRF) as given by Sphincs.tree_params()
+        :param buffer: values of the table, a zeroed bytearray is allocated when None
+        """
+        n, w, h, d, _ = params
+
+        self.public_key = bytes(public_key)
+        self.params = tuple(params)
+        self.suite_name = suite_name
+        self.layer = layer
+        self.tree = tree
+
+        self.n = n
+        self.w = w
+        self.len_0 = len_0
+        self.leaves = 2 ** (h // d)
+        self.size = self.leaves * len_0 * w * n
+
+        if buffer is None:
+            buffer = bytearray(self.size)
+        elif len(buffer) != self.size:
+            raise ValueError("Chain table must be " + str(self.size) + " bytes long, got " + str(len(buffer)))
+        self.buffer = buffer
+        self._mmap = None
+        self._file = None
+
+    def _header(self):
+        n, w, h, d, legacy_prf = self.params
+        header = _HEADER.pack(self.MAGIC, self.VERSION, n, w, h, d, int(legacy_prf), self.len_0, self.layer,
+                              self.tree, self.suite_name.encode()) + self.public_key
+        return header + hashlib.sha256(header).digest()
+
+    def set_chain(self, leaf, chain, values):
+        """
+        :param values: the w values of the chain, position 0 first
+        """
+        offset = (leaf * self.len_0 + chain) * self.w * self.n
+        self.buffer[offset:offset + self.w * self.n] = b''.join(values)
+
+    def value(self, leaf, chain, pos):
+        offset = ((leaf * self.len_0 + chain) * self.w + pos) * self.n
+        return bytes(self.buffer[offset:offset + self.n])
+
+    def signature(self, leaf, msg):
+        """
+        :param msg: chain positions of the base w message with its checksum
+        :return: WOTS+ signature of leaf
+        """
+        buffer = self.buffer
+        n = self.n
+        offset = leaf * self.len_0 * self.w
+        sig = []
+        for c in range(0, self.len_0):
+            start = (offset + c * self.w + msg[c]) * n
+            sig.append(bytes(buffer[start:start + n]))
+        return sig
+
+    def ends(self, leaf):
+        """
+        :return: end of every chain of leaf concatenated, hashed into its public key
+        """
+        return b''.join(self.value(leaf, c, self.w - 1) for c in range(0, self.len_0))
+
+    def save(self, path):
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            header = self._header()
+            f.write(header + bytes(self.PAGE - len(header)))
+            f.write(self.buffer)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Map a saved table read-only
+        :return: ChainTable
+        """
+        f = open(path, 'rb')
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            f.close()
+            raise
+
+        try:
+            magic, version, n, w, h, d, legacy_prf, len_0, layer, tree, suite_name = _HEADER.unpack_from(mm, 0)
+            if magic != cls.MAGIC:
+                raise ValueError(path + " is not a chain table")
+            if version != cls.VERSION:
+                raise ValueError("Chain table version " + str(version) + " is not supported")
+
+            public_key = mm[_HEADER.size:_HEADER.size + 2 * n]
+            table = cls(public_key, (n, w, h, d, bool(legacy_prf)), suite_name.rstrip(b'\0').decode(), len_0,
+                        layer, tree, memoryview(mm)[cls.PAGE:])
+            header = table._header()
+            if mm[:len(header)] != header:
+                raise ValueError("Chain table " + path + " has a corrupted header")
+        except Exception:
+            mm.close()
+            f.close()
+            raise
+
+        table._mmap = mm
+        table._file = f
+        return table
+
+    def close(self):
+        if self._mmap is not None:
+            self.buffer.release()
+            self._mmap.close()
+            self._file.close()
+            self._mmap = None
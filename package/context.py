@@ -0,0 +1,75 @@
+"""
+Class KeyContext, parsed SPHINCS+ key holding precomputed hash states
+"""
+
+import hashlib
+
+from package.hash_suites import Sha256Suite
+
+
+class KeyContext:
+
+    def __init__(self, n, public_seed, public_root, secret_seed=None, secret_prf=None, suite=Sha256Suite):
+        self.n = n
+
+        self.secret_seed = secret_seed
+        self.secret_prf = secret_prf
+        self.public_seed = public_seed
+        self.public_root = public_root
+
+        # The suite absorbs what depends on the key only once, hashing then copies its states
+        self.suite = suite(n, public_seed, secret_seed, secret_prf)
+        self.hash = self.suite.hash
+        self.prf = self.suite.prf
+        self.prf_msg = self.suite.prf_msg
+        self.prf_msg_init = self.suite.prf_msg_init
+        self.prf_msg_final = self.suite.prf_msg_final
+
+        # Identifies the key in caches without keeping its seeds as keys, the secret part alone when there is one
+        # so that the context used by keygen (PK.root still unknown) matches the contexts signing later
+        key_id = hashlib.sha256(self.suite.name.encode() + bytes([n]) + public_seed)
+        key_id.update(secret_seed if secret_seed is not None else public_root)
+        self.key_id = key_id.digest()
+
+        # Every node of the top layer XMSS tree concatenated by height (leaf WOTS+ public keys first), with the
+        # parameters it was built with, see Sphincs.build_top_tree
+        self.top_tree = None
+        self.top_tree_params = None
+
+    @classmethod
+    def from_secret_key(cls, sk, n, suite=Sha256Suite):
+        """
+        :param sk: Secret Key SK.seed || SK.prf || PK.seed || PK.root
+        """
+        if len(sk) != 4 * n:
+            raise ValueError("Secret key must be " + str(4 * n) + " bytes long, got " + str(len(sk)))
+        sk = bytes(sk)
+        return cls(n, sk[2 * n:3 * n], sk[3 * n:4 * n], sk[:n], sk[n:2 * n], suite)
+
+    @classmethod
+    def from_public_key(cls, pk, n, suite=Sha256Suite):
+        """
+        :param pk: Public Key PK.seed || PK.root
+        """
+        if len(pk) != 2 * n:
+            raise ValueError("Public key must be " + str(2 * n) + " bytes long, got " + str(len(pk)))
+        pk = bytes(pk)
+        return cls(n, pk[:n], pk[n:2 * n], suite=suite)
+
+    def has_secret(self):
+        return self.secret_seed is not None
+
+    def secret_key(self):
+        return self.secret_seed + self.secret_prf + self.public_seed + self.public_root
+
+    def public_key(self):
+        return self.public_seed + self.public_root
+
+    def hash_msg(self, r, value, digest_size):
+        return self.suite.hash_msg(r, self.public_root, value, digest_size)
+
+    def hash_msg_init(self, r):
+        return self.suite.hash_msg_init(r, self.public_root)
+
+    def hash_msg_final(self, r, state, digest_size):
+        return self.suite.hash_msg_final(r, state, digest_size)
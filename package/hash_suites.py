@@ -0,0 +1,370 @@
+"""
+Hash suites, the tweakable hash functions (F, H, T), PRF, PRF_msg and H_msg of each SPHINCS+ instantiation
+"""
+
+import hmac
+import time
+import hashlib
+from abc import ABC, abstractmethod
+
+from package.adrs import ADRS
+
+
+HASH_SUITES = {}
+
+
+def register_hash_suite(suite):
+    """
+    Make a hash suite available under its name, can be used as a class decorator
+    :param suite: HashSuite subclass implementing every abstract method
+    :return: suite
+    """
+    if not suite.name:
+        raise ValueError("A hash suite needs a name")
+    if suite.__abstractmethods__:
+        raise ValueError("Hash suite " + suite.name + " does not implement " +
+                         ", ".join(sorted(suite.__abstractmethods__)))
+    HASH_SUITES[suite.name] = suite
+    return suite
+
+
+def get_hash_suite(name):
+    if name not in HASH_SUITES:
+        raise ValueError("Unknown hash suite " + repr(name) + ", available: " + ", ".join(sorted(HASH_SUITES)))
+    return HASH_SUITES[name]
+
+
+# Input: hash function name, seed, output length
+# Output: MGF1 mask of the given length (RFC 8017)
+def mgf1(hash_name, seed, length):
+    out = bytearray()
+    counter = 0
+    while len(out) < length:
+        out += hashlib.new(hash_name, seed + counter.to_bytes(4, 'big')).digest()
+        counter += 1
+    return bytes(out[:length])
+
+
+def xor_bytes(x, y):
+    return (int.from_bytes(x, 'big') ^ int.from_bytes(y, 'big')).to_bytes(len(x), 'big')
+
+
+class HashSuite(ABC):
+    """
+    Hash functions of one instantiation, bound to the seeds of a key so that everything depending on the key
+    only is computed once
+    """
+
+    name = None
+    max_n = None
+
+    def __init__(self, n, public_seed, secret_seed=None, secret_prf=None):
+        if self.max_n is not None and n > self.max_n:
+            raise ValueError("Hash suite " + self.name + " supports n up to " + str(self.max_n) + ", got " + str(n))
+
+        self.n = n
+        self.public_seed = public_seed
+        self.secret_seed = secret_seed
+        self.secret_prf = secret_prf
+
+    # F, H and T_l: n-byte tweakable hash of an l * n-byte value
+    @abstractmethod
+    def hash(self, adrs: ADRS, value):
+        pass
+
+    # PRF(PK.seed, SK.seed, ADRS)
+    @abstractmethod
+    def prf(self, adrs: ADRS):
+        pass
+
+    # PRF_msg(SK.prf, OptRand, M)
+    def prf_msg(self, opt, m):
+        state = self.prf_msg_init(opt)
+        state.update(m)
+        return self.prf_msg_final(state)
+
+    # H_msg(R, PK.seed, PK.root, M)
+    def hash_msg(self, r, public_root, m, digest_size):
+        state = self.hash_msg_init(r, public_root)
+        state.update(m)
+        return self.hash_msg_final(r, state, digest_size)
+
+    # Incremental PRF_msg: the returned state absorbs M through update(), prf_msg_final gives the result
+    @abstractmethod
+    def prf_msg_init(self, opt):
+        pass
+
+    @abstractmethod
+    def prf_msg_final(self, state):
+        pass
+
+    # Incremental H_msg: the returned state absorbs M through update(), hash_msg_final gives the result
+    @abstractmethod
+    def hash_msg_init(self, r, public_root):
+        pass
+
+    @abstractmethod
+    def hash_msg_final(self, r, state, digest_size):
+        pass
+
+
+@register_hash_suite
+class Sha256Suite(HashSuite):
+    """
+    Original instantiation of this implementation: truncated SHA-256(PK.seed || ADRS || M) with the 32-byte ADRS,
+    H_msg appending a counter byte for every extra 32-byte block
+    """
+
+    name = 'sha256'
+    max_n = 32
+
+    def __init__(self, n, public_seed, secret_seed=None, secret_prf=None):
+        super().__init__(n, public_seed, secret_seed, secret_prf)
+
+        self._seed_state = hashlib.sha256(public_seed)
+        # PRF prefix PK.seed || toByte(0, 64 - n) is a full block, its compression is done once here
+        self._prf_state = hashlib.sha256(public_seed + bytes(64 - n))
+        self._prf_msg_mac = None
+        if secret_prf is not None:
+            self._prf_msg_mac = hmac.new(secret_prf, digestmod=hashlib.sha256)
+
+    def hash(self, adrs: ADRS, value):
+        m = self._seed_state.copy()
+
+        m.update(adrs.to_bin())
+        m.update(value)
+
+        return m.digest()[:self.n]
+
+    def prf(self, adrs: ADRS):
+        m = self._prf_state.copy()
+
+        m.update(adrs.to_bin())
+        m.update(self.secret_seed)
+
+        return m.digest()[:self.n]
+
+    def prf_msg_init(self, opt):
+        mac = self._prf_msg_mac.copy()
+        mac.update(opt)
+        return mac
+
+    def prf_msg_final(self, state):
+        return state.digest()[:self.n]
+
+    def hash_msg_init(self, r, public_root):
+        state = hashlib.sha256()
+
+        state.update(r)
+        state.update(self.public_seed)
+        state.update(public_root)
+
+        return state
+
+    def hash_msg_final(self, r, state, digest_size):
+        hashed = state.digest()[:digest_size]
+
+        # Every extra block only appends its counter to the state that already absorbed the message
+        i = 0
+        while len(hashed) < digest_size:
+            i += 1
+            block = state.copy()
+            block.update(bytes([i]))
+
+            hashed += block.digest()[:digest_size - len(hashed)]
+
+        return hashed
+
+
+@register_hash_suite
+class Sha2SimpleSuite(HashSuite):
+    """
+    FIPS 205 SHA2 instantiation: compressed ADRS, PK.seed padded to a full block, SHA-256 for F and PRF,
+    SHA-512 for H, T, PRF_msg and H_msg when n > 16
+    """
+
+    name = 'sha2-simple'
+    max_n = 32
+
+    def __init__(self, n, public_seed, secret_seed=None, secret_prf=None):
+        super().__init__(n, public_seed, secret_seed, secret_prf)
+
+        self._hash_name = 'sha256' if n <= 16 else 'sha512'
+        block_size = 64 if n <= 16 else 128
+
+        # PK.seed || toByte(0, block - n) fills a whole block, every call starts from its compressed state
+        self._f_state = hashlib.sha256(public_seed + bytes(64 - n))
+        self._h_state = hashlib.new(self._hash_name, public_seed + bytes(block_size - n))
+        self._prf_msg_mac = None
+        if secret_prf is not None:
+            self._prf_msg_mac = hmac.new(secret_prf, digestmod=self._hash_name)
+
+    def hash(self, adrs: ADRS, value):
+        m = (self._f_state if len(value) == self.n else self._h_state).copy()
+
+        m.update(adrs.to_bin_compressed())
+        m.update(value)
+
+        return m.digest()[:self.n]
+
+    def prf(self, adrs: ADRS):
+        m = self._f_state.copy()
+
+        m.update(adrs.to_bin_compressed())
+        m.update(self.secret_seed)
+
+        return m.digest()[:self.n]
+
+    def prf_msg_init(self, opt):
+        mac = self._prf_msg_mac.copy()
+        mac.update(opt)
+        return mac
+
+    def prf_msg_final(self, state):
+        return state.digest()[:self.n]
+
+    def hash_msg_init(self, r, public_root):
+        state = hashlib.new(self._hash_name)
+
+        state.update(r)
+        state.update(self.public_seed)
+        state.update(public_root)
+
+        return state
+
+    def hash_msg_final(self, r, state, digest_size):
+        return mgf1(self._hash_name, bytes(r) + self.public_seed + state.digest(), digest_size)
+
+
+@register_hash_suite
+class Sha2RobustSuite(Sha2SimpleSuite):
+    """
+    SPHINCS+ SHA2 robust instantiation: the hashed value is first masked with MGF1(PK.seed || ADRSc)
+    """
+
+    name = 'sha2-robust'
+
+    def hash(self, adrs: ADRS, value):
+        adrs_c = adrs.to_bin_compressed()
+        hash_name = 'sha256' if len(value) == self.n else self._hash_name
+        mask = mgf1(hash_name, self.public_seed + adrs_c, len(value))
+
+        m = (self._f_state if len(value) == self.n else self._h_state).copy()
+
+        m.update(adrs_c)
+        m.update(xor_bytes(value, mask))
+
+        return m.digest()[:self.n]
+
+
+@register_hash_suite
+class ShakeSimpleSuite(HashSuite):
+    """
+    FIPS 205 SHAKE instantiation: SHAKE256 everywhere, any n, and H_msg reads its whole output from one XOF
+    """
+
+    name = 'shake-simple'
+
+    def __init__(self, n, public_seed, secret_seed=None, secret_prf=None):
+        super().__init__(n, public_seed, secret_seed, secret_prf)
+
+        self._seed_state = hashlib.shake_256(public_seed)
+        self._prf_msg_state = None
+        if secret_prf is not None:
+            self._prf_msg_state = hashlib.shake_256(secret_prf)
+
+    def hash(self, adrs: ADRS, value):
+        m = self._seed_state.copy()
+
+        m.update(adrs.to_bin())
+        m.update(value)
+
+        return m.digest(self.n)
+
+    def prf(self, adrs: ADRS):
+        m = self._seed_state.copy()
+
+        m.update(adrs.to_bin())
+        m.update(self.secret_seed)
+
+        return m.digest(self.n)
+
+    def prf_msg_init(self, opt):
+        state = self._prf_msg_state.copy()
+        state.update(opt)
+        return state
+
+    def prf_msg_final(self, state):
+        return state.digest(self.n)
+
+    def hash_msg_init(self, r, public_root):
+        state = hashlib.shake_256()
+
+        state.update(r)
+        state.update(self.public_seed)
+        state.update(public_root)
+
+        return state
+
+    def hash_msg_final(self, r, state, digest_size):
+        return state.digest(digest_size)
+
+
+@register_hash_suite
+class ShakeRobustSuite(ShakeSimpleSuite):
+    """
+    SPHINCS+ SHAKE robust instantiation: the hashed value is first masked with SHAKE256(PK.seed || ADRS)
+    """
+
+    name = 'shake-robust'
+
+    def hash(self, adrs: ADRS, value):
+        mask_state = self._seed_state.copy()
+        mask_state.update(adrs.to_bin())
+
+        m = self._seed_state.copy()
+
+        m.update(adrs.to_bin())
+        m.update(xor_bytes(value, mask_state.digest(len(value))))
+
+        return m.digest(self.n)
+
+
+def measure_throughput(names=None, n=16, iterations=20000, message_size=1 << 20):
+    """
+    Time every hash suite on the calls SPHINCS+ makes
+    :param names: suites to measure, every registered suite when None
+    :param n: security parameter
+    :param iterations: number of F / H / PRF calls timed
+    :param message_size: byte size of the message given to H_msg
+    :return: dict name -> {'F': calls/s, 'H': calls/s, 'PRF': calls/s, 'H_msg': MB/s}
+    """
+    if names is None:
+        names = sorted(HASH_SUITES)
+
+    adrs = ADRS()
+    one = bytes(n)
+    two = bytes(2 * n)
+    message = bytes(message_size)
+    results = {}
+
+    for name in names:
+        suite = get_hash_suite(name)(n, bytes(n), bytes(n), bytes(n))
+        result = {}
+
+        for label, call in (('F', lambda: suite.hash(adrs, one)),
+                            ('H', lambda: suite.hash(adrs, two)),
+                            ('PRF', lambda: suite.prf(adrs))):
+            start = time.perf_counter()
+            for i in range(0, iterations):
+                adrs.set_hash_address(i)
+                call()
+            result[label] = iterations / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        suite.hash_msg(one, one, message, 64)
+        result['H_msg'] = message_size / (time.perf_counter() - start) / 1e6
+
+        results[name] = result
+
+    return results
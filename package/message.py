@@ -0,0 +1,73 @@
+"""
+Class MessageSource, message to sign or verify read chunk by chunk
+"""
+
+import mmap
+import tempfile
+
+
+class MessageSource:
+    """
+    Message given as bytes-like object (bytes, bytearray, memoryview, mmap), binary file object or iterable of
+    bytes chunks. Signing reads the message twice (PRF_msg then H_msg), files are read again from their starting
+    position and iterables are spooled to a temporary file on the first read, so memory use stays constant
+    """
+
+    CHUNK_SIZE = 1 << 20
+
+    def __init__(self, m, chunk_size=CHUNK_SIZE):
+        self._chunk_size = chunk_size
+        self._buffer = None
+        self._file = None
+        self._start = 0
+        self._iterator = None
+        self._spool = None
+
+        if isinstance(m, (bytes, bytearray, memoryview, mmap.mmap)):
+            self._buffer = m
+        elif hasattr(m, 'read'):
+            self._file = m
+            if m.seekable():
+                self._start = m.tell()
+            else:
+                self._iterator = iter(lambda: m.read(chunk_size), b'')
+                self._file = None
+        else:
+            self._iterator = iter(m)
+
+    def chunks(self):
+        """
+        Read the whole message, can be called again to read it once more
+        """
+        if self._buffer is not None:
+            yield self._buffer
+            return
+
+        if self._file is not None:
+            self._file.seek(self._start)
+            yield from self._read_file(self._file)
+            return
+
+        if self._spool is not None:
+            self._spool.seek(0)
+            yield from self._read_file(self._spool)
+            return
+
+        # First read of an iterable, every chunk is also kept in the spool for the next reads
+        self._spool = tempfile.SpooledTemporaryFile(max_size=self._chunk_size)
+        for chunk in self._iterator:
+            self._spool.write(chunk)
+            yield chunk
+        self._iterator = None
+
+    def _read_file(self, file):
+        while True:
+            chunk = file.read(self._chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
@@ -0,0 +1,93 @@
+"""
+Record the PRF a stored secret key was generated with
+
+    python -m package.migrate_key sk_entidad.json
+
+Keys generated before the hash-based PRF became the default were derived with Python's Mersenne Twister and only sign
+valid signatures with set_legacy_prf(True). Key files saved without a "sphincs_prf" field get it here: "legacy" or
+"hash", found by rebuilding the top layer XMSS tree of the key with each PRF until it leads to PK.root. Signing
+applications then select the PRF from the field instead of detecting it at every start.
+
+A legacy key cannot be converted to the hash-based PRF, every secret value and PK.root depend on the PRF: a new key
+has to be generated and its public key distributed, the legacy one keeps signing until then
+"""
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+
+from package.sphincs import Sphincs
+
+PRF_FIELD = 'sphincs_prf'
+PRF_HASH = 'hash'
+PRF_LEGACY = 'legacy'
+
+
+def prf_name(legacy_prf):
+    return PRF_LEGACY if legacy_prf else PRF_HASH
+
+
+def write_key_file(path, data):
+    # Replaced at once and with the permissions of the former file, it holds the secret key
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, os.stat(path).st_mode & 0o777)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m package.migrate_key',
+                                     description="Record in a key file the PRF its key was generated with")
+    parser.add_argument('key', help="secret key file, JSON with a sphincs_sk field")
+    parser.add_argument('--check', action='store_true', help="only report the PRF, the file is not changed")
+    parser.add_argument('--n', type=int, default=16)
+    parser.add_argument('--w', type=int, default=16)
+    parser.add_argument('--h', type=int, default=64)
+    parser.add_argument('--d', type=int, default=8)
+    parser.add_argument('--hash-suite', default='sha256')
+    args = parser.parse_args(argv)
+
+    with open(args.key, 'r') as f:
+        data = json.load(f)
+    if not isinstance(data, dict) or 'sphincs_sk' not in data:
+        print(args.key, "has no sphincs_sk field", file=sys.stderr)
+        return 1
+
+    if PRF_FIELD in data:
+        print(args.key, "already records the", data[PRF_FIELD], "PRF")
+        return 0
+
+    sphincs = Sphincs()
+    sphincs.set_n(args.n)
+    sphincs.set_w(args.w)
+    sphincs.set_h(args.h)
+    sphincs.set_d(args.d)
+    sphincs.set_hash_suite(args.hash_suite)
+
+    try:
+        prf = prf_name(sphincs.detect_legacy_prf(bytes.fromhex(data['sphincs_sk'])))
+    except ValueError as e:
+        print(args.key + ":", e, file=sys.stderr)
+        return 1
+
+    print(args.key, "was generated with the", prf, "PRF")
+    if not args.check:
+        data[PRF_FIELD] = prf
+        write_key_file(args.key, data)
+        print("Recorded as", PRF_FIELD, "in", args.key)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,204 @@
+"""
+Class NodeStore, memory-mapped file keeping the XMSS subtrees of the top hypertree layers of a key
+"""
+
+import os
+import mmap
+import struct
+import hashlib
+
+# magic, version, n, w, h, d, stored layers, legacy PRF, hash suite name
+_HEADER = struct.Struct('>8sHHHHHHB16s')
+
+
+class NodeStore:
+    """
+    File layout, every part starting on a page boundary:
+    header: fields of _HEADER || PK.seed || PK.root || SHA-256 of everything before
+    flags: one byte per stored subtree, set once all of its nodes are written
+    records: (2 ** (h' + 1) - 1) * n bytes per stored subtree, sparse until filled. Node (height z, index i) of a
+    subtree is at position sum(2 ** (h' - y) for y < z) + i of its record
+
+    Subtrees are numbered from the top layer down, tree address order inside a layer.
+    Several processes can map the same file, readers only see subtrees whose flag is set
+    """
+
+    MAGIC = b'SPXNODES'
+    VERSION = 1
+    PAGE = 4096
+
+    def __init__(self, path, public_key, params, suite_name, layers=2, readonly=False):
+        """
+        :param path: file of the store, created when missing (unless readonly)
+        :param public_key: PK.seed || PK.root the nodes belong to
+        :param params: (n, w, h, d, legacy PRF) as given by Sphincs.tree_params()
+        :param suite_name: name of the hash suite of the key
+        :param layers: number of top layers stored, only used when the file is created
+        :param readonly: map the file read-only, nothing is written to it
+        """
+        n, w, h, d, legacy_prf = params
+        if not 1 <= layers <= d:
+            raise ValueError("A node store holds between 1 and d=" + str(d) + " layers, got " + str(layers))
+        if len(public_key) != 2 * n:
+            raise ValueError("Public key must be " + str(2 * n) + " bytes long, got " + str(len(public_key)))
+
+        self.path = path
+        self.public_key = bytes(public_key)
+        self.params = tuple(params)
+        self.suite_name = suite_name
+        self.readonly = readonly
+
+        self.n = n
+        self.h_prime = h // d
+        self.d = d
+
+        if not os.path.exists(path):
+            if readonly:
+                raise FileNotFoundError(path)
+            self._create(layers)
+
+        # The size is checked against the header and the layout before mapping, reading past the end of a mapped
+        # file is a bus error
+        self._file = open(path, 'rb' if readonly else 'r+b')
+        try:
+            size = os.fstat(self._file.fileno()).st_size
+            if size < self.PAGE:
+                raise ValueError("Node store " + path + " is truncated")
+            self.layers = self._check_header(self._file.read(self.PAGE))
+            self._layout()
+            if size < self._records_offset + self._trees * self.tree_size:
+                raise ValueError("Node store " + path + " is truncated")
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ if readonly else mmap.ACCESS_WRITE)
+        except Exception:
+            self._file.close()
+            raise
+
+    @classmethod
+    def file_size(cls, params, layers):
+        """
+        Size of a store without creating it
+        :param params: (n, w, h, d, legacy PRF) as given by Sphincs.tree_params()
+        :param layers: number of top layers stored
+        :return: number of subtrees stored, and size of the file in bytes
+        """
+        n, _, h, d, _ = params
+        h_prime = h // d
+        trees = sum(2 ** (i * h_prime) for i in range(0, layers))
+        return trees, cls.PAGE + -(-trees // cls.PAGE) * cls.PAGE + trees * (2 ** (h_prime + 1) - 1) * n
+
+    def _header(self, layers):
+        n, w, h, d, legacy_prf = self.params
+        header = _HEADER.pack(self.MAGIC, self.VERSION, n, w, h, d, layers, int(legacy_prf),
+                              self.suite_name.encode()) + self.public_key
+        return header + hashlib.sha256(header).digest()
+
+    def _check_header(self, page):
+        magic, version, _, _, _, _, layers = _HEADER.unpack_from(page, 0)[:7]
+        if magic != self.MAGIC:
+            raise ValueError(self.path + " is not a node store")
+        if version != self.VERSION:
+            raise ValueError("Node store version " + str(version) + " is not supported")
+
+        header = self._header(layers)
+        if not 1 <= layers <= self.d or page[:len(header)] != header:
+            raise ValueError("Node store " + self.path + " belongs to another key, hash suite or parameters")
+
+        return layers
+
+    def _layout(self):
+        self.tree_size = (2 ** (self.h_prime + 1) - 1) * self.n
+
+        # First stored subtree of every layer, top layer first
+        self._first_tree = {}
+        self._trees = 0
+        for layer in range(self.d - 1, self.d - 1 - self.layers, -1):
+            self._first_tree[layer] = self._trees
+            self._trees += 2 ** ((self.d - 1 - layer) * self.h_prime)
+
+        self._flags_offset = self.PAGE
+        self._records_offset = self._flags_offset + -(-self._trees // self.PAGE) * self.PAGE
+
+        # Offset of every height inside a record
+        self._level_offsets = [0]
+        for z in range(0, self.h_prime + 1):
+            self._level_offsets.append(self._level_offsets[z] + (2 ** (self.h_prime - z)) * self.n)
+
+    def _create(self, layers):
+        self.layers = layers
+        self._layout()
+
+        # Filled aside and linked in place, a concurrent process either finds no file or a complete header
+        tmp_path = self.path + '.' + str(os.getpid()) + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(self._header(layers))
+            f.truncate(self._records_offset + self._trees * self.tree_size)
+        try:
+            os.link(tmp_path, self.path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+            self._mmap = None
+
+    def holds(self, layer, tree):
+        return layer in self._first_tree and tree < 2 ** ((self.d - 1 - layer) * self.h_prime)
+
+    def contains(self, layer, tree):
+        return self.holds(layer, tree) and self._mmap[self._flags_offset + self._first_tree[layer] + tree] == 1
+
+    def get(self, layer, tree):
+        """
+        :return: nodes of the subtree concatenated by height (leaves first, root last), None when not stored
+        """
+        if not self.contains(layer, tree):
+            return None
+
+        offset = self._records_offset + (self._first_tree[layer] + tree) * self.tree_size
+        record = self._mmap[offset:offset + self.tree_size]
+        return tuple(record[self._level_offsets[z]:self._level_offsets[z + 1]] for z in range(0, self.h_prime + 1))
+
+    def node(self, layer, tree, height, index):
+        """
+        :return: n-byte node of the subtree, None when the subtree is not stored
+        """
+        if not self.contains(layer, tree):
+            return None
+
+        offset = self._records_offset + (self._first_tree[layer] + tree) * self.tree_size + \
+            self._level_offsets[height] + index * self.n
+        return self._mmap[offset:offset + self.n]
+
+    def put(self, layer, tree, levels):
+        """
+        Write every node of a subtree, ignored when read-only or when the layer is not stored
+        :param levels: nodes concatenated by height, as returned by get
+        """
+        if self.readonly or not self.holds(layer, tree) or self.contains(layer, tree):
+            return
+
+        offset = self._records_offset + (self._first_tree[layer] + tree) * self.tree_size
+        self._mmap[offset:offset + self.tree_size] = b''.join(levels)
+        # The flag goes after the nodes, a reader never sees a partly written subtree as present
+        self._mmap[self._flags_offset + self._first_tree[layer] + tree] = 1
+
+    def flush(self):
+        if not self.readonly:
+            self._mmap.flush()
+
+    def stored_trees(self):
+        """
+        :return: number of subtrees filled so far, and of subtrees the store can hold
+        """
+        flags = self._mmap[self._flags_offset:self._flags_offset + self._trees]
+        return flags.count(1), self._trees
@@ -0,0 +1,72 @@
+"""
+Class Parameters, immutable parameter set of a Sphincs instance, and class ParameterGuard keeping it fixed while
+operations run
+"""
+
+import threading
+from contextlib import contextmanager
+from collections import namedtuple
+
+Parameters = namedtuple('Parameters', ['n', 'w', 'h', 'd', 'k', 'a', 'randomize', 'legacy_prf', 'hash_suite'])
+
+
+class ParameterGuard:
+    """
+    Operations of several threads run together while no parameter change is applied or waiting, a change waits for
+    the running operations to finish and the next operations wait for the change, so that changes are not starved by
+    a continuous flow of operations. A thread applying a change can apply nested ones and run operations, a thread
+    running an operation can run nested ones but cannot change the parameters
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._operations = 0
+        self._owner = None
+        self._depth = 0
+        self._waiting = 0
+        self._local = threading.local()
+
+    @contextmanager
+    def operation(self):
+        me = threading.get_ident()
+        nested = getattr(self._local, 'operations', 0) > 0
+        with self._condition:
+            # A nested operation does not wait for waiting changes, they wait for its outer operation
+            while self._owner != me and (self._owner is not None or self._waiting > 0 and not nested):
+                self._condition.wait()
+            self._operations += 1
+        self._local.operations = getattr(self._local, 'operations', 0) + 1
+        try:
+            yield
+        finally:
+            self._local.operations -= 1
+            with self._condition:
+                self._operations -= 1
+                if self._operations == 0:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def change(self):
+        me = threading.get_ident()
+        with self._condition:
+            if self._owner != me:
+                if getattr(self._local, 'operations', 0) > 0:
+                    raise RuntimeError("Parameters cannot change during an operation of the same thread")
+                self._waiting += 1
+                try:
+                    while self._owner is not None or self._operations > 0:
+                        self._condition.wait()
+                finally:
+                    self._waiting -= 1
+                    self._condition.notify_all()
+                self._owner = me
+            self._depth += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._owner = None
+                    self._condition.notify_all()
+
@@ -0,0 +1,114 @@
+"""
+Offline precomputation of the top hypertree layers of a signing key
+
+    python -m package.precompute sk_entidad.json --layers 1 --output sk_entidad.sigs --node-store sk_entidad.nodes
+
+The key file holds the secret key in hex, alone or as the "sphincs_sk" field of a JSON object. The PRF of the key is
+taken from its "sphincs_prf" field (see package.migrate_key), --legacy-prf selects the legacy one for files without it.
+The key is checked against PK.root with the PRF before the precomputation starts.
+Every XMSS signature of the top layers is computed and written to the output file (a hypertree snapshot, public), the
+memory the XMSS signature cache needs to keep them is reported. A signing process fills its cache from the file with
+load_xmss_signatures, which checks them up to PK.root. With --node-store the subtrees are also written to a node store
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+from package.migrate_key import PRF_FIELD, PRF_HASH, PRF_LEGACY, prf_name
+from package.node_store import NodeStore
+from package.sphincs import Sphincs
+
+
+# Output: secret key, and PRF recorded with it (None when the file does not record it)
+def read_secret_key(path):
+    with open(path, 'r') as f:
+        text = f.read().strip()
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        return bytes.fromhex(text), None
+    if isinstance(data, dict):
+        return bytes.fromhex(data['sphincs_sk']), data.get(PRF_FIELD)
+    return bytes.fromhex(data), None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m package.precompute',
+                                     description="Precompute the XMSS signatures of the top hypertree layers")
+    parser.add_argument('key', help="secret key file, hex or JSON with a sphincs_sk field")
+    parser.add_argument('--layers', type=int, default=1, help="number of top layers (default 1)")
+    parser.add_argument('--output', help="file receiving the signatures (default: key file with a .sigs suffix)")
+    parser.add_argument('--node-store', help="node store file receiving the subtrees")
+    parser.add_argument('--estimate', action='store_true', help="only report the sizes")
+    parser.add_argument('--n', type=int, default=16)
+    parser.add_argument('--w', type=int, default=16)
+    parser.add_argument('--h', type=int, default=64)
+    parser.add_argument('--d', type=int, default=8)
+    parser.add_argument('--hash-suite', default='sha256')
+    parser.add_argument('--legacy-prf', action='store_true', help="key of the legacy PRF, when its file does not "
+                                                                  "record the PRF")
+    args = parser.parse_args(argv)
+    output = args.output if args.output else os.path.splitext(args.key)[0] + '.sigs'
+
+    sk, prf = read_secret_key(args.key)
+    if prf is None:
+        prf = prf_name(args.legacy_prf)
+    elif prf not in (PRF_HASH, PRF_LEGACY):
+        print(args.key + ": unknown PRF", prf, file=sys.stderr)
+        return 1
+    elif args.legacy_prf and prf != PRF_LEGACY:
+        print(args.key, "records the", prf, "PRF, not the legacy one", file=sys.stderr)
+        return 1
+
+    sphincs = Sphincs()
+    sphincs.set_n(args.n)
+    sphincs.set_w(args.w)
+    sphincs.set_h(args.h)
+    sphincs.set_d(args.d)
+    sphincs.set_hash_suite(args.hash_suite)
+    sphincs.set_legacy_prf(prf == PRF_LEGACY)
+
+    count, size = sphincs.xmss_signatures_size(args.layers)
+    print("XMSS signatures of the top", args.layers, "layers:", count)
+    print("XMSS signature cache:", size, "bytes")
+
+    # The layer below the precomputed ones is built too, its roots are the signed messages
+    store_layers = min(args.layers + 1, args.d)
+    if args.estimate:
+        if args.node_store:
+            trees, file_size = NodeStore.file_size(sphincs.tree_params(), store_layers)
+            print("Node store:", store_layers, "layers,", trees, "subtrees,", file_size, "bytes at most on disk")
+        return 0
+
+    # The top layer tree is built once to check the key and its PRF, it also serves the precomputation
+    try:
+        ctx = sphincs.secret_key_context(sk, keep_top_tree=True)
+    except ValueError as e:
+        print(args.key + ":", e, "and the", prf, "PRF (python -m package.migrate_key --check finds its PRF)",
+              file=sys.stderr)
+        return 1
+
+    store = None
+    if args.node_store:
+        store = sphincs.open_node_store(args.node_store, ctx, layers=store_layers)
+        print("Node store:", store.layers, "layers,", store.stored_trees()[1], "subtrees,",
+              os.path.getsize(args.node_store), "bytes at most on disk")
+
+    start = time.perf_counter()
+    sphincs.export_hypertree_snapshot(output, ctx, args.layers)
+    print("Computed", count, "signatures in", round(time.perf_counter() - start, 1), "s")
+    print("Signatures:", output, os.path.getsize(output), "bytes, loaded with load_xmss_signatures")
+
+    if store is not None:
+        store.flush()
+        print("Node store:", store.stored_trees()[0], "subtrees stored")
+        store.close()
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
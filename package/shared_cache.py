@@ -0,0 +1,171 @@
+"""
+Class SharedNodeCache, XMSS subtree node cache in shared memory for several processes
+"""
+
+import struct
+import hashlib
+import multiprocessing
+from multiprocessing import shared_memory
+
+_SEQUENCE = struct.Struct('<Q')
+_TAG_SIZE = 16
+
+
+def _attach(name):
+    # Attaching processes must not unlink the segment when they exit, only its creator does. Before Python 3.13
+    # they register it again, harmless for workers sharing the resource tracker of the creator
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedNodeCache:
+    """
+    Same interface as LRUCache for the nodes of whole subtrees, in fixed-size slots of a shared memory segment:
+    sequence number (8 bytes) || tag of the key (16 bytes) || nodes of the subtree concatenated by height.
+    A key always goes to the same slot and replaces what it held. Keys hold every parameter their subtree depends on
+    (Sphincs.node_cache_key), the tag hashes all of them.
+
+    Writers take a lock and make the sequence number odd while they write, readers take no lock: they copy the slot
+    and keep it only when the sequence number was even and unchanged around the copy (seqlock).
+    Created once by a parent process, the cache is given to workers through inheritance (Pool initializer
+    arguments, Process arguments). Statistics are counted per process
+    """
+
+    def __init__(self, n, h_prime, max_bytes, name=None, lock=None, mp_context=None):
+        """
+        :param n: security parameter of the signing instance
+        :param h_prime: height of its subtrees, h / d
+        :param max_bytes: size of the segment, slots taking (2 ** (h' + 1) - 1) * n bytes and 24 bytes of header
+        :param name: attach to the existing segment of that name instead of creating one
+        :param mp_context: multiprocessing context of the workers, its lock protects the writers
+        """
+        self.n = n
+        self.h_prime = h_prime
+        self.value_size = (2 ** (h_prime + 1) - 1) * n
+        self.slot_size = _SEQUENCE.size + _TAG_SIZE + self.value_size
+        self.slots = max_bytes // self.slot_size
+        if self.slots == 0:
+            raise ValueError("A shared node cache needs at least " + str(self.slot_size) + " bytes, got " +
+                             str(max_bytes))
+        self.max_bytes = self.slots * self.slot_size
+
+        self._owner = name is None
+        if self._owner:
+            self._memory = shared_memory.SharedMemory(create=True, size=self.max_bytes)
+            self._memory.buf[:self.max_bytes] = bytes(self.max_bytes)
+        else:
+            self._memory = _attach(name)
+        self.name = self._memory.name
+        self._buf = self._memory.buf
+        if lock is None:
+            lock = (mp_context if mp_context is not None else multiprocessing).Lock()
+        self._lock = lock
+
+        # Offset of every height in a value
+        self._level_offsets = [0]
+        for z in range(0, h_prime + 1):
+            self._level_offsets.append(self._level_offsets[z] + (2 ** (h_prime - z)) * n)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __getstate__(self):
+        return self.n, self.h_prime, self.max_bytes, self.name, self._lock
+
+    def __setstate__(self, state):
+        n, h_prime, max_bytes, name, lock = state
+        self.__init__(n, h_prime, max_bytes, name, lock)
+
+    def __len__(self):
+        count = 0
+        for slot in range(0, self.slots):
+            offset = slot * self.slot_size + _SEQUENCE.size
+            if self._buf[offset:offset + _TAG_SIZE] != bytes(_TAG_SIZE):
+                count += 1
+        return count
+
+    def _tag(self, key):
+        return hashlib.blake2b(repr(key).encode(), digest_size=_TAG_SIZE).digest()
+
+    def _slot(self, tag):
+        return int.from_bytes(tag[:8], 'little') % self.slots * self.slot_size
+
+    def get(self, key):
+        """
+        :return: nodes of the subtree concatenated by height, None when missing or being written
+        """
+        tag = self._tag(key)
+        offset = self._slot(tag)
+        buf = self._buf
+
+        value = None
+        sequence = _SEQUENCE.unpack_from(buf, offset)[0]
+        if sequence % 2 == 0 and buf[offset + _SEQUENCE.size:offset + _SEQUENCE.size + _TAG_SIZE] == tag:
+            data = bytes(buf[offset + _SEQUENCE.size + _TAG_SIZE:offset + self.slot_size])
+            if _SEQUENCE.unpack_from(buf, offset)[0] == sequence:
+                value = tuple(data[self._level_offsets[z]:self._level_offsets[z + 1]]
+                              for z in range(0, self.h_prime + 1))
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key, value, size):
+        """
+        :param size: bytes of value, only whole subtrees of the cache parameters are stored
+        """
+        if size != self.value_size:
+            return
+
+        tag = self._tag(key)
+        offset = self._slot(tag)
+        buf = self._buf
+
+        with self._lock:
+            sequence = _SEQUENCE.unpack_from(buf, offset)[0]
+            held = buf[offset + _SEQUENCE.size:offset + _SEQUENCE.size + _TAG_SIZE]
+            if held != tag and held != bytes(_TAG_SIZE):
+                self.evictions += 1
+
+            _SEQUENCE.pack_into(buf, offset, sequence + 1)
+            buf[offset + _SEQUENCE.size:offset + _SEQUENCE.size + _TAG_SIZE] = tag
+            buf[offset + _SEQUENCE.size + _TAG_SIZE:offset + self.slot_size] = b''.join(value)
+            _SEQUENCE.pack_into(buf, offset, sequence + 2)
+
+    def clear(self):
+        with self._lock:
+            for slot in range(0, self.slots):
+                offset = slot * self.slot_size
+                sequence = _SEQUENCE.unpack_from(self._buf, offset)[0]
+                _SEQUENCE.pack_into(self._buf, offset, sequence + 1)
+                self._buf[offset + _SEQUENCE.size:offset + _SEQUENCE.size + _TAG_SIZE] = bytes(_TAG_SIZE)
+                _SEQUENCE.pack_into(self._buf, offset, sequence + 2)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        entries = len(self)
+        return {
+            'entries': entries,
+            'bytes': entries * self.value_size,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        """
+        Detach this process from the segment, the creating process also removes it
+        """
+        if self._buf is None:
+            return
+        self._buf = None
+        self._memory.close()
+        if self._owner:
+            self._memory.unlink()
@@ -0,0 +1,91 @@
+"""
+Class Signature, SPHINCS+ signature R || SIG_FORS || SIG_HT held in a single buffer
+"""
+
+
+class Signature:
+
+    def __init__(self, n, k, a, d, h_prime, len_0, data=None):
+        """
+        :param data: encoded signature to read, a zeroed buffer is allocated to be written when None
+        """
+        self.n = n
+        self.k = k
+        self.a = a
+        self.d = d
+        self.h_prime = h_prime
+        self.len_0 = len_0
+
+        # Offsets of R, of each FORS tree (sk || AUTH) and of each XMSS layer (sig || AUTH)
+        self.fors_tree_size = (a + 1) * n
+        self.xmss_size = (len_0 + h_prime) * n
+        self.r_offset = 0
+        self.fors_offsets = [n + i * self.fors_tree_size for i in range(0, k)]
+        self.ht_offset = n + k * self.fors_tree_size
+        self.xmss_offsets = [self.ht_offset + j * self.xmss_size for j in range(0, d)]
+        self.size = self.ht_offset + d * self.xmss_size
+
+        if data is None:
+            data = bytearray(self.size)
+        elif len(data) != self.size:
+            raise ValueError("Signature must be " + str(self.size) + " bytes long, got " + str(len(data)))
+
+        self.data = data
+        self.view = memoryview(data)
+
+    def __len__(self):
+        return self.size
+
+    def __bytes__(self):
+        return bytes(self.data)
+
+    def nodes(self, offset, count):
+        """
+        :return: list of count n-byte views starting at offset
+        """
+        n = self.n
+        return [self.view[offset + i * n:offset + (i + 1) * n] for i in range(0, count)]
+
+    def write_nodes(self, offset, nodes):
+        n = self.n
+        for i in range(0, len(nodes)):
+            self.data[offset + i * n:offset + (i + 1) * n] = nodes[i]
+
+    # R
+    def get_r(self):
+        return self.view[0:self.n]
+
+    def set_r(self, r):
+        self.data[0:self.n] = r
+
+    # SIG_FORS = (sk_0 || AUTH_0) || ... || (sk_{k-1} || AUTH_{k-1})
+    def get_sig_fors(self):
+        return self.nodes(self.n, self.k * (self.a + 1))
+
+    def set_sig_fors(self, sig_fors):
+        self.write_nodes(self.n, sig_fors)
+
+    def get_fors_sk(self, i):
+        return self.view[self.fors_offsets[i]:self.fors_offsets[i] + self.n]
+
+    def get_fors_auth(self, i):
+        return self.nodes(self.fors_offsets[i] + self.n, self.a)
+
+    # SIG_HT = SIG_XMSS_0 || ... || SIG_XMSS_{d-1}, SIG_XMSS = (sig || AUTH)
+    def get_sig_ht(self):
+        return self.nodes(self.ht_offset, self.d * (self.len_0 + self.h_prime))
+
+    def set_sig_ht(self, sig_ht):
+        self.write_nodes(self.ht_offset, sig_ht)
+
+    def get_sig_xmss(self, layer):
+        return self.nodes(self.xmss_offsets[layer], self.len_0 + self.h_prime)
+
+    def set_sig_xmss(self, layer, sig_xmss):
+        self.write_nodes(self.xmss_offsets[layer], sig_xmss)
+
+    def get_wots_sig(self, layer):
+        return self.nodes(self.xmss_offsets[layer], self.len_0)
+
+    def get_auth(self, layer):
+        return self.nodes(self.xmss_offsets[layer] + self.len_0 * self.n, self.h_prime)
@@ -0,0 +1,159 @@
+"""
+Class HypertreeSnapshot, public subtree roots of the upper hypertree layers with the XMSS signatures authenticating them
+"""
+
+import mmap
+import struct
+
+# magic, version, n, w, h, d, len_0, listed layers, hash suite name
+_HEADER = struct.Struct('>8sHHHHHHH16s')
+
+
+class HypertreeSnapshot:
+    """
+    File layout: fields of _HEADER || PK.seed || PK.root, then one record per subtree of the listed layers,
+    from the lowest listed layer up to layer d - 2, tree address order inside a layer.
+    A record is the root of the subtree followed by the XMSS signature of that root made by the layer above,
+    (len_0 + h / d + 1) * n bytes. Nothing in it is secret.
+    Once checked, the roots are kept in private memory by keep_roots and the file is no longer read
+    """
+
+    MAGIC = b'SPXROOTS'
+    VERSION = 1
+
+    def __init__(self, public_key, params, suite_name, len_0, layers, buffer=None):
+        """
+        :param public_key: PK.seed || PK.root of the key
+        :param params: (n, w, h, d, ...) as given by Sphincs.tree_params()
+        :param layers: number of layers listed under the top one
+        :param buffer: encoded snapshot, header included, an empty one is allocated when None
+        """
+        n, w, h, d = params[:4]
+        if not 1 <= layers < d:
+            raise ValueError("A snapshot lists between 1 and d - 1 = " + str(d - 1) + " layers, got " + str(layers))
+
+        self.public_key = bytes(public_key)
+        self.params = (n, w, h, d)
+        self.suite_name = suite_name
+        self.len_0 = len_0
+        self.layers = layers
+
+        self.n = n
+        self.h_prime = h // d
+        self.d = d
+        self.record_size = (len_0 + self.h_prime + 1) * n
+
+        self.header_size = _HEADER.size + 2 * n
+        # First record of every listed layer
+        self._first = {}
+        records = 0
+        for layer in range(d - 1 - layers, d - 1):
+            self._first[layer] = records
+            records += 2 ** ((d - 1 - layer) * self.h_prime)
+        self.size = self.header_size + records * self.record_size
+
+        if buffer is None:
+            buffer = bytearray(self.size)
+            buffer[:self.header_size] = self._header()
+        elif len(buffer) != self.size:
+            raise ValueError("Snapshot must be " + str(self.size) + " bytes long, got " + str(len(buffer)))
+        self.buffer = buffer
+        self._roots = None
+        self._mmap = None
+        self._file = None
+
+    def _header(self):
+        n, w, h, d = self.params
+        return _HEADER.pack(self.MAGIC, self.VERSION, n, w, h, d, self.len_0, self.layers,
+                            self.suite_name.encode()) + self.public_key
+
+    def holds(self, layer):
+        return layer in self._first
+
+    def _offset(self, layer, tree):
+        return self.header_size + (self._first[layer] + tree) * self.record_size
+
+    def set_record(self, layer, tree, root, sig_xmss):
+        offset = self._offset(layer, tree)
+        self.buffer[offset:offset + self.record_size] = bytes(root) + b''.join(bytes(node) for node in sig_xmss)
+
+    def root(self, layer, tree):
+        if self._roots is not None:
+            return self._roots[layer][tree * self.n:(tree + 1) * self.n]
+
+        offset = self._offset(layer, tree)
+        return bytes(self.buffer[offset:offset + self.n])
+
+    def layer_roots(self, layer):
+        """
+        :return: copy of every root of the layer concatenated, tree address order
+        """
+        return b''.join(self.root(layer, tree) for tree in range(0, self.trees(layer)))
+
+    def keep_roots(self, roots):
+        """
+        Answer root from the given copies only and close the file: once they are checked, rewriting or truncating
+        the file cannot change them. The XMSS signatures are no longer available
+        :param roots: dict layer -> roots of the layer concatenated, as given by layer_roots
+        """
+        if set(roots) != set(self._first):
+            raise ValueError("Roots of layers " + str(sorted(self._first)) + " expected, got " + str(sorted(roots)))
+        self._roots = dict(roots)
+        self.close()
+        self.buffer = None
+
+    def sig_xmss(self, layer, tree):
+        """
+        :return: XMSS signature of the root of the subtree, list of n-byte nodes
+        """
+        if self.buffer is None:
+            raise ValueError("The XMSS signatures of a snapshot are not kept once its roots are checked")
+        offset = self._offset(layer, tree) + self.n
+        return [bytes(self.buffer[offset + i * self.n:offset + (i + 1) * self.n])
+                for i in range(0, self.len_0 + self.h_prime)]
+
+    def trees(self, layer):
+        return 2 ** ((self.d - 1 - layer) * self.h_prime)
+
+    def save(self, path):
+        if self.buffer is None:
+            raise ValueError("A snapshot whose roots are checked only keeps its roots and cannot be saved")
+        with open(path, 'wb') as f:
+            f.write(self.buffer)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Map a saved snapshot read-only, its records still have to be checked against PK.root
+        :return: HypertreeSnapshot
+        """
+        f = open(path, 'rb')
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            f.close()
+            raise
+
+        try:
+            magic, version, n, w, h, d, len_0, layers, suite_name = _HEADER.unpack_from(mm, 0)
+            if magic != cls.MAGIC:
+                raise ValueError(path + " is not a hypertree snapshot")
+            if version != cls.VERSION:
+                raise ValueError("Hypertree snapshot version " + str(version) + " is not supported")
+
+            public_key = mm[_HEADER.size:_HEADER.size + 2 * n]
+            snapshot = cls(public_key, (n, w, h, d), suite_name.rstrip(b'\0').decode(), len_0, layers, mm)
+        except Exception:
+            mm.close()
+            f.close()
+            raise
+
+        snapshot._mmap = mm
+        snapshot._file = f
+        return snapshot
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+            self._mmap = None
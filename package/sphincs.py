@@ -3,60 +3,62 @@ SPHINCS Class, giving access to every functions useful
 """
 
 import os
+import json
 import math
+import time
 import random
-import hashlib
+import functools
+import itertools
+import threading
+from contextlib import contextmanager
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 
 from package.adrs import ADRS
+from package.cache import LRUCache
+from package.chain_table import ChainTable
+from package.context import KeyContext
+from package.hash_suites import get_hash_suite, Sha256Suite
+from package.message import MessageSource
+from package.node_store import NodeStore
+from package.parameters import Parameters, ParameterGuard
+from package.shared_cache import SharedNodeCache
+from package.signature import Signature
+from package.snapshot import HypertreeSnapshot
 
 
 # TWEAKABLES & UTILS
-def hash(seed, adrs: ADRS, value, digest_size):
-    m = hashlib.sha256()
+# Former PRF seeding Python's Mersenne Twister, only kept to sign with keys generated before hash-based PRF.
+# A generator of its own gives the values the global one gave, without sharing its state between threads
+def prf_legacy(secret_seed, adrs, digest_size):
+    generator = random.Random(int.from_bytes(secret_seed + adrs.to_bin(), "big"))
+    return generator.randint(0, 256 ** digest_size - 1).to_bytes(digest_size, byteorder='big')
 
-    m.update(seed)
-    m.update(adrs.to_bin())
-    m.update(value)
 
-    hashed = m.digest()[:digest_size]
+# Former PRF_msg seeding Python's Mersenne Twister with SK.prf || OptRand || H_msg(0, 0, 0, M), only kept to sign
+# with keys generated before hash-based PRF
+def prf_msg_legacy(secret_seed, opt, m_digest, digest_size):
+    generator = random.Random(int.from_bytes(secret_seed + opt + m_digest, "big"))
+    return generator.randint(0, 256 ** digest_size - 1).to_bytes(digest_size, byteorder='big')
 
-    return hashed
 
+# Method running with the parameters of its instance fixed, several threads can run such methods at once
+def operation(method):
+    @functools.wraps(method)
+    def guarded(self, *args, **kwargs):
+        with self._guard.operation():
+            return method(self, *args, **kwargs)
+    return guarded
 
-def prf(secret_seed, adrs, digest_size):
-    random.seed(int.from_bytes(secret_seed + adrs.to_bin(), "big"))
-    return random.randint(0, 256 ** digest_size - 1).to_bytes(digest_size, byteorder='big')
 
+# Method changing the parameters, modes or caches of its instance, it waits for the running operations to finish
+def parameter_change(method):
+    @functools.wraps(method)
+    def guarded(self, *args, **kwargs):
+        with self._guard.change():
+            return method(self, *args, **kwargs)
+    return guarded
 
-def hash_msg(r, public_seed, public_root, value, digest_size):
-    m = hashlib.sha256()
-
-    m.update(r)
-    m.update(public_seed)
-    m.update(public_root)
-    m.update(value)
-
-    hashed = m.digest()[:digest_size]
-
-    i = 0
-    while len(hashed) < digest_size:
-        i += 1
-        m = hashlib.sha256()
-
-        m.update(r)
-        m.update(public_seed)
-        m.update(public_root)
-        m.update(value)
-        m.update(bytes([i]))
-
-        hashed += m.digest()[:digest_size - len(hashed)]
-
-    return hashed
-
-
-def prf_msg(secret_seed, opt, m, digest_size):
-    random.seed(int.from_bytes(secret_seed + opt + hash_msg(b'0', b'0', b'0', m, digest_size * 2), "big"))
-    return random.randint(0, 256 ** digest_size - 1).to_bytes(digest_size, byteorder='big')
 
 def print_bytes_bit(value):
     array = []
@@ -88,9 +90,39 @@ def base_w(x, w, out_len):
 
 
 class Sphincs():
-
-    def __init__(self):
+    """
+    Thread safety: sign, sign_many, verify, generate_key_pair and the exports can be called from several threads at
+    once on the same instance, with the same key context or not. The legacy PRF has no global state, the caches take a
+    lock. Every setter of a parameter, mode or cache (set_n, set_node_cache, set_parallel_signing, open_node_store,
+    load_hypertree_snapshot, ...) waits for the running operations and holds the next ones until it returns, so an
+    operation sees a single configuration from start to end. A setter called during an operation of its own thread
+    raises RuntimeError
+    """
+
+    def __init__(self, parameters=None):
+        """
+        :param parameters: Parameters to start with, as given by settings() of another instance, defaults otherwise
+        """
+        self._guard = ParameterGuard()
+        self._pool_lock = threading.Lock()
         self._randomize = True
+        self._legacy_prf = False
+        self._hash_suite = 'sha256'
+        self._node_cache = None
+        self._traversal_cut = 0
+        self._traversal_memory = None
+        self._traversal = None
+        self._node_store = None
+        self._xmss_signature_cache = None
+        self._root_cache = None
+        self._checkpoint_interval = 30
+        self._sign_workers = None
+        self._verify_many_stats = None
+        self._sign_pool = None
+        self._pool_users = {}
+        self._snapshot = None
+        self._chain_table_cutoff = None
+        self._chain_tables = None
 
         self._n = 16
         self._w = 16
@@ -105,6 +137,9 @@ class Sphincs():
         self._h_prime = self._h // self._d
         self._t = 2 ** self._a
 
+        if parameters is not None:
+            self.apply_settings(parameters)
+
     def calculate_variables(self):
         self._len_1 = math.ceil(8 * self._n / math.log(self._w, 2))
         self._len_2 = math.floor(math.log(self._len_1 * (self._w - 1), 2) / math.log(self._w, 2)) + 1
@@ -112,14 +147,57 @@ class Sphincs():
         self._h_prime = self._h // self._d
         self._t = 2 ** self._a
 
+        # Cached subtrees and signatures were built with the former tree shape. The shared node cache is left to the
+        # other processes using it, this one detaches from it until set_shared_node_cache is called again
+        if self._traversal_memory is not None:
+            self.set_traversal_memory(self._traversal_memory)
+        if isinstance(self._node_cache, SharedNodeCache):
+            self._node_cache = None
+        if self._node_cache is not None:
+            self._node_cache.clear()
+        if self._xmss_signature_cache is not None:
+            self._xmss_signature_cache.clear()
+        if self._root_cache is not None:
+            self._root_cache.clear()
+        if self._chain_tables is not None:
+            self._chain_tables.clear()
+
     # CLASS IMPLEMENTATION OF SPHINCS
     # =================================================
 
-    def generate_key_pair(self):
+    @operation
+    def generate_key_pair(self, keep_top_tree=False, checkpoint=None, workers=None):
         """
         Generate a key pair for sphincs signatures
+        :param keep_top_tree: return the secret key as a KeyContext keeping the top layer XMSS tree computed to
+        get PK.root, signing with it takes the top layer authentication path from that tree instead of rebuilding it.
+        The secret key bytes are given by its secret_key()
+        :param checkpoint: file where the progress is saved every set_checkpoint_interval seconds, resume_keygen
+        continues an interrupted generation from it. It holds the secret seeds, is only readable by its owner and is
+        removed once the key is generated. It must not exist yet, FileExistsError is raised otherwise.
+        Not combined with keep_top_tree or workers, ValueError is raised
+        :param workers: number of processes building the top layer tree, each one taking a range of its leaves.
+        The key is the one a single process would generate
         :return: secret key and public key
         """
+        if checkpoint is not None:
+            if keep_top_tree or workers:
+                raise ValueError("A checkpointed key generation runs in this process and does not keep the top tree, "
+                                 "keep_top_tree and workers cannot be given with checkpoint")
+            if os.path.exists(checkpoint):
+                raise FileExistsError("Checkpoint " + str(checkpoint) + " already exists, continue its key generation "
+                                      "with resume_keygen or remove it")
+
+            ctx = KeyContext(self._n, os.urandom(self._n), bytes(), os.urandom(self._n), os.urandom(self._n),
+                             get_hash_suite(self._hash_suite))
+            return self.checkpointed_keygen(ctx, 0, [], checkpoint)
+
+        if keep_top_tree or workers:
+            ctx = self.spx_keygen_context(keep_top_tree, workers)
+            if keep_top_tree:
+                return ctx, ctx.public_key()
+            return ctx.secret_key(), ctx.public_key()
+
         sk, pk = self.spx_keygen()
         sk_0, pk_0 = bytes(), bytes()
 
@@ -130,66 +208,261 @@ class Sphincs():
 
         return sk_0, pk_0
 
+    @operation
+    def resume_keygen(self, path):
+        """
+        Continue a key generation interrupted after saving a checkpoint, the key is the one it would have generated
+        :param path: checkpoint file given to generate_key_pair, removed once the key is generated
+        :return: secret key and public key
+        """
+        with open(path, 'r') as f:
+            state = json.load(f)
+
+        if state.get('version') != 1:
+            raise ValueError(path + " is not a key generation checkpoint")
+        params = [state['n'], state['w'], state['h'], state['d'], state['legacy_prf']]
+        if tuple(params) != self.tree_params() or state['hash_suite'] != self._hash_suite:
+            raise ValueError("Checkpoint made with n, w, h, d, legacy PRF = " + str(params) + " and " +
+                             state['hash_suite'] + ", this instance uses " + str(list(self.tree_params())) +
+                             " and " + self._hash_suite)
+
+        ctx = KeyContext(self._n, bytes.fromhex(state['public_seed']), bytes(), bytes.fromhex(state['secret_seed']),
+                         bytes.fromhex(state['secret_prf']), get_hash_suite(self._hash_suite))
+        stack = [(bytes.fromhex(node), height) for node, height in state['stack']]
+        return self.checkpointed_keygen(ctx, state['next_leaf'], stack, path)
+
+    def secret_key_context(self, sk, keep_top_tree=False):
+        """
+        Parse a secret key once and precompute its hash states, the result can be given to sign instead of sk
+        :param sk: Secret Key
+        :param keep_top_tree: also build the top layer XMSS tree once, every signature then takes its
+        authentication path from it. Raise ValueError if the tree does not lead to PK.root
+        :return: KeyContext of sk
+        """
+        if isinstance(sk, KeyContext):
+            self.check_key_context(sk)
+            ctx = sk
+        else:
+            ctx = KeyContext.from_secret_key(sk, self._n, get_hash_suite(self._hash_suite))
+
+        if keep_top_tree and ctx.top_tree_params != self.tree_params():
+            if self.build_top_tree(ctx) != ctx.public_root:
+                ctx.top_tree = None
+                ctx.top_tree_params = None
+                raise ValueError("Secret key does not lead to its PK.root with the parameters of this instance")
+
+        return ctx
+
+    def public_key_context(self, pk):
+        """
+        Parse a public key once and precompute its hash states, the result can be given to verify instead of pk
+        :param pk: Public Key
+        :return: KeyContext of pk
+        """
+        if isinstance(pk, KeyContext):
+            self.check_key_context(pk)
+            return pk
+        return KeyContext.from_public_key(pk, self._n, get_hash_suite(self._hash_suite))
+
+    def check_key_context(self, ctx):
+        if ctx.n != self._n or ctx.suite.name != self._hash_suite:
+            raise ValueError("Key context made for n=" + str(ctx.n) + " with " + ctx.suite.name +
+                             ", this instance uses n=" + str(self._n) + " with " + self._hash_suite)
+
+    def detect_legacy_prf(self, sk):
+        """
+        Find the PRF a key was generated with, for keys stored without it: its top layer XMSS tree is built with the
+        PRF of this instance, then with the other one, until it leads to PK.root. The other parameters are the ones
+        of this instance
+        :param sk: Secret Key
+        :return: Boolean, True when the key was generated with the legacy Mersenne Twister PRF.
+        Raise ValueError if neither PRF leads to PK.root
+        """
+        for legacy_prf in (self._legacy_prf, not self._legacy_prf):
+            probe = Sphincs(self.settings()._replace(legacy_prf=legacy_prf))
+            try:
+                probe.secret_key_context(sk, keep_top_tree=True)
+            except ValueError:
+                continue
+            return legacy_prf
+
+        raise ValueError("Secret key does not lead to its PK.root with either PRF, its parameters or hash suite differ")
+
+    @operation
     def sign(self, m, sk):
         """
         Sign a message with sphincs algorithm
-        :param m: Message to be signed
-        :param sk: Secret Key
+        :param m: Message to be signed, bytes-like object (mmap included), binary file object or iterable of bytes
+        chunks. Files and iterables are read in chunks with constant memory
+        :param sk: Secret Key, or its KeyContext
         :return: Signature of m with sk
         """
-        sk_tab = []
+        ctx = self.secret_key_context(sk)
+        source = MessageSource(m)
+        try:
+            sig = self.spx_sign(source, ctx)
+        finally:
+            source.close()
+
+        return bytes(sig.data)
+
+    @operation
+    def sign_many(self, messages, sk):
+        """
+        Sign a batch of messages with the same key. The randomizer and hypertree position of every message are
+        computed first, then each XMSS subtree reached by several messages is built once and signs for all of them
+        (in this process, parallel signing is not used)
+        :param messages: iterable of messages, each one as accepted by sign
+        :param sk: Secret Key, or its KeyContext
+        :return: list of signatures in the order of messages, the ones sign gives for each of them when randomization
+        is off (otherwise each one has its own random randomizer, as with sign)
+        """
+        ctx = self.secret_key_context(sk)
+        sigs = []
+        positions = []
 
-        for i in range(0, 4):
-            sk_tab.append(sk[(i * self._n):((i + 1) * self._n)])
+        for m in messages:
+            source = MessageSource(m)
+            try:
+                r, md, idx_tree, idx_leaf = self.randomized_digest(source, ctx)
+            finally:
+                source.close()
 
-        sig_tab = self.spx_sign(m, sk_tab)
+            adrs = ADRS()
+            adrs.set_layer_address(0)
+            adrs.set_tree_address(idx_tree)
+            adrs.set_type(ADRS.FORS_TREE)
+            adrs.set_key_pair_address(idx_leaf)
+            sig_fors, pk_fors = self.fors_sign(md, ctx, adrs)
 
-        sig = sig_tab[0]  # R
-        for i in sig_tab[1]:  # SIG FORS
-            sig += i
-        for i in sig_tab[2]:  # SIG Hypertree
-            sig += i
+            sig = self.new_signature()
+            sig.set_r(r)
+            sig.set_sig_fors(sig_fors)
+            sigs.append(sig)
+            positions.append((pk_fors, idx_tree, idx_leaf))
 
-        return sig
+        for sig, sig_ht in zip(sigs, self.ht_sign_many(positions, ctx)):
+            sig.set_sig_ht(sig_ht)
 
+        return [bytes(sig.data) for sig in sigs]
+
+    @operation
     def verify(self, m, sig, pk):
         """
         Check integrity of signature
-        :param m: Message signed
+        :param m: Message signed, bytes-like object (mmap included), binary file object or iterable of bytes chunks
         :param sig: Signature of m
-        :param pk: Public Key
+        :param pk: Public Key, or its KeyContext
         :return: Boolean True if signature correct
         """
-        pk_tab = []
-
-        for i in range(0, 2):
-            pk_tab.append(pk[(i * self._n):((i + 1) * self._n)])
-
-        sig_tab = []
+        if not isinstance(sig, Signature):
+            if len(sig) != self.signature_size():
+                return False
+            sig = self.new_signature(sig)
+
+        ctx = self.public_key_context(pk)
+        source = MessageSource(m)
+        try:
+            return self.spx_verify(source, sig, ctx)
+        finally:
+            source.close()
+
+    def verify_many(self, items, workers=None, chunk_size=64, ordered=True):
+        """
+        Check many signatures, on a process pool whose workers get the parameters once. Items are read as the
+        results are consumed, a bounded number of chunks is in flight at any time
+        :param items: iterable of (message, signature, public key) triples, messages must be bytes-like with workers
+        :param workers: number of processes, None verifies in this process
+        :param chunk_size: number of triples sent to a worker at once
+        :param ordered: yield the results in input order, otherwise as chunks complete
+        :return: generator of Booleans, or of (index, Boolean) pairs when not ordered.
+        Throughput is given by get_verify_many_stats(). Invalid arguments raise here, before the first result
+        """
+        if workers is not None and (isinstance(workers, bool) or not isinstance(workers, int) or workers < 1):
+            raise ValueError("Workers must be None or a positive number of processes, got " + repr(workers))
+        if isinstance(chunk_size, bool) or not isinstance(chunk_size, int) or chunk_size < 1:
+            raise ValueError("Chunk size must be a positive number of items, got " + repr(chunk_size))
+        items = iter(items)
+
+        stats = {'items': 0, 'seconds': 0.0, 'items_per_second': 0.0, 'workers': workers if workers else 1}
+        self._verify_many_stats = stats
+        return self.verify_many_results(items, workers, chunk_size, ordered, self.settings(), stats)
+
+    # Input: iterator of (message, signature, public key) triples, workers, chunk size, Boolean, Parameters, stats
+    # Output: generator of the results of verify_many, updating its stats
+    def verify_many_results(self, items, workers, chunk_size, ordered, settings, stats):
+        start = time.perf_counter()
+
+        def done(count):
+            stats['items'] += count
+            stats['seconds'] = time.perf_counter() - start
+            if stats['seconds'] > 0:
+                stats['items_per_second'] = stats['items'] / stats['seconds']
+
+        if workers is None or workers == 1:
+            for index, (m, sig, pk) in enumerate(items):
+                valid = self.verify(m, sig, pk)
+                done(1)
+                yield valid if ordered else (index, valid)
+            return
+
+        index = 0
+        pending = deque()
+        pool = self.worker_pool(None, workers, settings)
+        try:
+            while True:
+                # Two chunks per worker keep them busy without reading the whole input
+                while len(pending) < 2 * workers:
+                    chunk = [(bytes(m), bytes(sig), bytes(pk)) for m, sig, pk in itertools.islice(items, chunk_size)]
+                    if len(chunk) == 0:
+                        break
+                    pending.append((index, pool.submit(worker_verify_chunk, chunk)))
+                    index += len(chunk)
 
-        sig_tab += [sig[:self._n]]  # R
+                if len(pending) == 0:
+                    break
 
-        sig_tab += [[]]  # SIG FORS
-        for i in range(self._n,
-                       self._n + self._k * (self._a + 1) * self._n,
-                       self._n):
-            sig_tab[1].append(sig[i:(i + self._n)])
+                if ordered:
+                    _, job = pending.popleft()
+                    results = job.result()
+                    done(len(results))
+                    yield from results
+                else:
+                    finished, _ = wait([job for _, job in pending], return_when=FIRST_COMPLETED)
+                    for first, job in [entry for entry in pending if entry[1] in finished]:
+                        pending.remove((first, job))
+                        results = job.result()
+                        done(len(results))
+                        yield from ((first + i, valid) for i, valid in enumerate(results))
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+    def get_verify_many_stats(self):
+        """
+        :return: dict with items verified, seconds, items_per_second and workers of the last verify_many, None before
+        """
+        return self._verify_many_stats
 
-        sig_tab += [[]]  # SIG Hypertree
-        for i in range(self._n + self._k * (self._a + 1) * self._n,
-                       self._n + self._k * (self._a + 1) * self._n + (self._h + self._d * self._len_0) * self._n,
-                       self._n):
-            sig_tab[2].append(sig[i:(i + self._n)])
+    def new_signature(self, data=None):
+        """
+        Signature laid out with the parameters of this instance
+        :param data: encoded signature to read, a zeroed buffer is allocated to be written when None
+        :return: Signature
+        """
+        return Signature(self._n, self._k, self._a, self._d, self._h_prime, self._len_0, data)
 
-        return self.spx_verify(m, sig_tab, pk_tab)
+    def signature_size(self):
+        return (1 + self._k * (self._a + 1) + self._h + self._d * self._len_0) * self._n
 
     # SETTERS / GETTERS
     # =================================================
 
+    @parameter_change
     def set_security(self, val):
         self._n = val
         self.calculate_variables()
 
+    @parameter_change
     def set_n(self, val):
         self._n = val
         self.calculate_variables()
@@ -197,11 +470,13 @@ class Sphincs():
     def get_security(self):
         return self._n
 
+    @parameter_change
     def set_winternitz(self, val):
         if val == 4 or val == 16 or val == 256:
             self._w = val
         self.calculate_variables()
 
+    @parameter_change
     def set_w(self, val):
         if val == 4 or val == 16 or val == 256:
             self._w = val
@@ -210,10 +485,12 @@ class Sphincs():
     def get_winternitz(self):
         return self._w
 
+    @parameter_change
     def set_hypertree_height(self, val):
         self._h = val
         self.calculate_variables()
 
+    @parameter_change
     def set_h(self, val):
         self._h = val
         self.calculate_variables()
@@ -221,10 +498,12 @@ class Sphincs():
     def get_hypertree_height(self):
         return self._h
 
+    @parameter_change
     def set_hypertree_layers(self, val):
         self._d = val
         self.calculate_variables()
 
+    @parameter_change
     def set_d(self, val):
         self._d = val
         self.calculate_variables()
@@ -232,10 +511,12 @@ class Sphincs():
     def get_hypertree_layers(self):
         return self._d
 
+    @parameter_change
     def set_fors_trees_number(self, val):
         self._k = val
         self.calculate_variables()
 
+    @parameter_change
     def set_k(self, val):
         self._k = val
         self.calculate_variables()
@@ -243,10 +524,12 @@ class Sphincs():
     def get_fors_trees_number(self):
         return self._k
 
+    @parameter_change
     def set_fors_trees_height(self, val):
         self._a = val
         self.calculate_variables()
 
+    @parameter_change
     def set_a(self, val):
         self._a = val
         self.calculate_variables()
@@ -254,9 +537,502 @@ class Sphincs():
     def get_fors_trees_height(self):
         return self._a
 
+    @parameter_change
+    def set_legacy_prf(self, val):
+        """
+        Derive secret values with the former Mersenne Twister PRF, needed to sign with keys generated before
+        the hash-based PRF. Verification does not use the PRF and accepts signatures made either way.
+        Signing a key with the other PRF gives invalid signatures: store the PRF with the key, detect_legacy_prf
+        finds it for keys stored without it
+        """
+        self._legacy_prf = bool(val)
+
+    def get_legacy_prf(self):
+        return self._legacy_prf
+
+    @parameter_change
+    def set_hash_suite(self, val):
+        """
+        Select the instantiation of the hash functions, by name in package.hash_suites.HASH_SUITES:
+        'sha256' (default, the original construction), 'sha2-simple', 'sha2-robust', 'shake-simple', 'shake-robust'
+        """
+        self._hash_suite = get_hash_suite(val).name
+
+    def get_hash_suite(self):
+        return self._hash_suite
+
+    @parameter_change
+    def set_parallel_signing(self, workers):
+        """
+        Sign with a process pool: the k FORS trees and the subtree of every hypertree layer are built at the same
+        time, only the WOTS+ signatures chaining the layers are computed here. Signatures are the same as without.
+        The pool is started at the first signature and kept for the following ones with the same key.
+        Combines with the caches of this instance: cached XMSS signatures and subtrees (top tree of the key context,
+        node cache, node store) are used here without a job, subtrees built by the workers are kept in the node
+        cache and node store. The workers do not use the WOTS+ chain tables, only the signatures made here do
+        :param workers: number of processes, None stops the pool and signs in this process again
+        """
+        with self._pool_lock:
+            if self._sign_pool is not None:
+                self.release_signing_pool(self._sign_pool[1])
+                self._sign_pool = None
+        self._sign_workers = workers if workers is not None and workers > 1 else None
+
+    def get_parallel_signing(self):
+        return self._sign_workers
+
+    @parameter_change
+    def set_checkpoint_interval(self, val):
+        """
+        Seconds between two checkpoints of generate_key_pair(checkpoint=...)
+        """
+        self._checkpoint_interval = val
+
+    def get_checkpoint_interval(self):
+        return self._checkpoint_interval
+
+    @parameter_change
+    def set_node_cache(self, max_bytes):
+        """
+        Keep every node of the XMSS subtrees recently used to sign, consecutive signatures sharing a subtree
+        (always the case on the top layers) only compute the WOTS+ signature of their leaf there.
+        Least recently used subtrees are dropped above the budget, a subtree takes (2 ** (h' + 1) - 1) * n bytes
+        :param max_bytes: memory budget of the cache, 0 or None disables it
+        """
+        self._node_cache = LRUCache(max_bytes) if max_bytes else None
+        self._traversal_cut = 0
+        self._traversal_memory = None
+        self._traversal = None
+
+    @parameter_change
+    def set_shared_node_cache(self, cache, mp_context=None):
+        """
+        Node cache in shared memory, one warm cache for every process signing with the same keys. The parent process
+        creates it and gives it to its workers (Pool initializer arguments), which pass it here too. Entries are
+        tagged with the key, the parameters and the hash suite, processes of other parameters never read them.
+        Changing a parameter of this instance detaches it from the cache without clearing it for the others
+        :param cache: SharedNodeCache made for the n and h / d of this instance, or a size in bytes to create one
+        :param mp_context: multiprocessing context starting the workers (multiprocessing.get_context('spawn'), ...)
+        when a cache is created, its lock must come from it. The default context otherwise
+        :return: SharedNodeCache, its creator removes it with close()
+        """
+        if not isinstance(cache, SharedNodeCache):
+            cache = SharedNodeCache(self._n, self._h_prime, cache, mp_context=mp_context)
+        elif (cache.n, cache.h_prime) != (self._n, self._h_prime):
+            raise ValueError("Shared node cache made for n=" + str(cache.n) + ", h/d=" + str(cache.h_prime) +
+                             ", this instance uses n=" + str(self._n) + ", h/d=" + str(self._h_prime))
+
+        self.set_node_cache(None)
+        self._node_cache = cache
+        return cache
+
+    @parameter_change
+    def set_traversal_memory(self, max_memory):
+        """
+        Traversal mode for a memory budget too small to keep whole subtrees: the node cache only keeps the levels of
+        each subtree from a cut height c, a signature rebuilds the 2 ** c leaves under the cut holding its leaf and
+        reads the rest of its authentication path from the kept levels. c is the lowest height for which the kept
+        levels of the d subtrees of one signature fit in max_memory
+        :param max_memory: memory budget in bytes, 0 or None goes back to rebuilding every subtree
+        :return: dict describing the trade-off chosen (see get_traversal), None when disabled
+        """
+        if not max_memory:
+            self.set_node_cache(None)
+            return None
+
+        cut = None
+        for c in range(0, self._h_prime + 1):
+            if self._d * self.kept_subtree_size(c) <= max_memory:
+                cut = c
+                break
+        if cut is None:
+            raise ValueError("Traversal needs at least d * n = " + str(self._d * self._n) + " bytes, got " +
+                             str(max_memory))
+
+        self.set_node_cache(max_memory)
+        self._traversal_cut = cut
+        self._traversal_memory = max_memory
+
+        # Hashes of one leaf: its chains, and their compression into the leaf
+        leaf_hashes = self._len_0 * (self._w - 1) + 1
+        self._traversal = {
+            'cut_height': cut,
+            'subtree_bytes': self.kept_subtree_size(cut),
+            'subtrees_kept': max_memory // self.kept_subtree_size(cut),
+            'leaves_rebuilt': 2 ** cut,
+            'hashes_per_subtree': 2 ** cut * leaf_hashes + 2 ** cut - 1,
+            'full_subtree_bytes': self.kept_subtree_size(0),
+            'full_rebuild_hashes': 2 ** self._h_prime * leaf_hashes + 2 ** self._h_prime - 1,
+        }
+        return self._traversal
+
+    def get_traversal(self):
+        """
+        :return: dict with cut_height, subtree_bytes (kept per subtree), subtrees_kept (fitting in the budget),
+        leaves_rebuilt and hashes_per_subtree (per signature and cached subtree), full_subtree_bytes and
+        full_rebuild_hashes (the same without traversal mode), None when disabled
+        """
+        return self._traversal
+
+    def kept_subtree_size(self, cut):
+        # Levels from height cut to the root
+        return (2 ** (self._h_prime + 1 - cut) - 1) * self._n
+
+    def tree_params(self):
+        """
+        :return: parameters every hypertree node depends on, besides the key
+        """
+        return self._n, self._w, self._h, self._d, self._legacy_prf
+
+    @parameter_change
+    def set_verified_root_cache(self, max_bytes):
+        """
+        Remember the subtree roots of signatures verified valid, per public key, layer and tree address. A later
+        signature reaching one of them is decided there without climbing the layers above it, the part of the
+        signature above is then not read: the message is authenticated but a signature altered only there still
+        verifies. Least recently used roots are dropped above the budget, a root takes n bytes
+        :param max_bytes: memory budget of the cache, 0 or None disables it
+        """
+        self._root_cache = LRUCache(max_bytes) if max_bytes else None
+
+    def get_verified_root_cache_stats(self):
+        """
+        :return: dict with entries, bytes, max_bytes, hits (early stops), misses, evictions and hit_rate,
+        None when disabled
+        """
+        if self._root_cache is None:
+            return None
+        return self._root_cache.stats()
+
+    @operation
+    def export_hypertree_snapshot(self, path, sk, layers=1):
+        """
+        Save the subtree roots of the layers under the top one, each with the XMSS signature authenticating it.
+        They are public, verifiers loading the file stop ht_verify on them
+        :param sk: Secret Key, or its KeyContext
+        :param layers: number of layers listed, layer d - 1 - i holds 2 ** (i * h / d) roots
+        :return: HypertreeSnapshot
+        """
+        if not 1 <= layers < self._d:
+            raise ValueError("Layers must be between 1 and d - 1 = " + str(self._d - 1) + ", got " + str(layers))
+
+        ctx = self.secret_key_context(sk)
+        snapshot = HypertreeSnapshot(ctx.public_key(), self.tree_params(), ctx.suite.name, self._len_0, layers)
+        for j, idx_tree, idx_leaf, sig_xmss, _, child_root in self.upper_xmss_signatures(ctx, layers):
+            snapshot.set_record(j - 1, (idx_tree << self._h_prime) | idx_leaf, child_root, sig_xmss)
+
+        snapshot.save(path)
+        return snapshot
+
+    @parameter_change
+    def load_hypertree_snapshot(self, path, pk):
+        """
+        Map a snapshot made by export_hypertree_snapshot and check every root it lists up to PK.root, ht_verify then
+        decides at the first listed root it reaches (the part of the signature above it is not read). The checked
+        roots are kept in memory and the file is closed, later changes to it have no effect
+        :param pk: Public Key, or its KeyContext
+        :return: HypertreeSnapshot, raise ValueError when it does not belong to pk or does not authenticate
+        """
+        ctx = self.public_key_context(pk)
+        snapshot = HypertreeSnapshot.load(path)
+
+        try:
+            snapshot.keep_roots(self.check_hypertree_snapshot(snapshot, ctx, path))
+        except Exception:
+            snapshot.close()
+            raise
+
+        self._snapshot = snapshot
+        return snapshot
+
+    @parameter_change
+    def load_xmss_signatures(self, path, sk):
+        """
+        Fill the XMSS signature cache (enabled with a budget of the needed size when disabled) from a file written by
+        export_hypertree_snapshot or python -m package.precompute, every signature being checked up to PK.root first.
+        Signatures then only compute the layers under the ones it lists and FORS
+        :param sk: Secret Key, or its KeyContext
+        :return: dict with layers, signatures, bytes and cached, as precompute_xmss_signatures
+        """
+        ctx = self.secret_key_context(sk)
+        snapshot = HypertreeSnapshot.load(path)
+
+        try:
+            count, size = self.xmss_signatures_size(snapshot.layers)
+            if self._xmss_signature_cache is None:
+                self.set_xmss_signature_cache(size)
+            self.check_hypertree_snapshot(snapshot, ctx, path, cache_signatures=True)
+        finally:
+            snapshot.close()
+
+        return {'layers': snapshot.layers, 'signatures': count, 'bytes': size,
+                'cached': len(self._xmss_signature_cache)}
+
+    # Input: hypertree snapshot, key context CTX, its file, Boolean to put the XMSS signatures in their cache
+    # Output: dict layer -> roots of the layer concatenated, every one checked up to PK.root
+    def check_hypertree_snapshot(self, snapshot, ctx, path, cache_signatures=False):
+        if snapshot.public_key != ctx.public_key() or snapshot.params != self.tree_params()[:4] or \
+                snapshot.suite_name != ctx.suite.name or snapshot.len_0 != self._len_0:
+            raise ValueError("Hypertree snapshot " + path + " belongs to another key, hash suite or parameters")
+
+        # Top-down, every root is checked against the one above it, already checked. Roots and signatures are copied
+        # before their check and only the copies are used afterwards, whatever happens to the file
+        n = self._n
+        roots = {self._d - 1: ctx.public_root}
+        adrs = ADRS()
+        for j in range(self._d - 2, self._d - 2 - snapshot.layers, -1):
+            roots[j] = snapshot.layer_roots(j)
+            for tree in range(0, snapshot.trees(j)):
+                parent = tree >> self._h_prime
+                leaf = tree % 2 ** self._h_prime
+                sig_xmss = snapshot.sig_xmss(j, tree)
+
+                adrs.set_layer_address(j + 1)
+                adrs.set_tree_address(parent)
+                node = self.xmss_pk_from_sig(leaf, sig_xmss, roots[j][tree * n:(tree + 1) * n], ctx, adrs)
+
+                parent_root = roots[j + 1][parent * n:(parent + 1) * n]
+                if node != parent_root:
+                    raise ValueError("Hypertree snapshot " + path + " does not authenticate root " + str(tree) +
+                                     " of layer " + str(j))
+
+                if cache_signatures:
+                    self._xmss_signature_cache.put((ctx.key_id, self._legacy_prf, j + 1, parent, leaf),
+                                                   (sig_xmss, parent_root), self.xmss_signature_entry_size())
+
+        del roots[self._d - 1]
+        return roots
+
+    @parameter_change
+    def set_xmss_signature_cache(self, max_bytes):
+        """
+        Keep the XMSS signatures made on layers 1 to d - 1, they only depend on the hypertree address and are shared
+        by every signature going through the same subtrees. A signature takes (len_0 + h / d + 1) * n bytes
+        :param max_bytes: memory budget of the cache, 0 or None disables it
+        """
+        self._xmss_signature_cache = LRUCache(max_bytes) if max_bytes else None
+
+    def get_xmss_signature_cache(self):
+        return self._xmss_signature_cache
+
+    def get_xmss_signature_cache_stats(self):
+        """
+        :return: dict with entries, bytes, max_bytes, hits, misses, evictions and hit_rate, None when disabled
+        """
+        if self._xmss_signature_cache is None:
+            return None
+        return self._xmss_signature_cache.stats()
+
+    def xmss_signature_entry_size(self):
+        # WOTS+ signature, authentication path and root of the subtree
+        return (self._len_0 + self._h_prime + 1) * self._n
+
+    def xmss_signatures_size(self, layers):
+        """
+        :param layers: number of top layers, layer 0 excluded
+        :return: number of XMSS signatures on these layers and bytes they take in the XMSS signature cache
+        """
+        count = sum(2 ** ((self._d - j) * self._h_prime) for j in range(self._d - layers, self._d))
+        return count, count * self.xmss_signature_entry_size()
+
+    @parameter_change
+    def precompute_xmss_signatures(self, sk, layers=1):
+        """
+        Fill the XMSS signature cache (enabled with a budget of the needed size when disabled) with every
+        signature of the top layers, signatures then only compute the lower layers and FORS.
+        Subtrees are taken from the node caches and node store when they hold them, and added to them otherwise
+        :param sk: Secret Key, or its KeyContext
+        :param layers: number of top layers, between 1 and d - 1
+        :return: dict with layers, signatures, bytes (needed by the cache) and cached (signatures the budget kept)
+        """
+        if not 1 <= layers < self._d:
+            raise ValueError("Layers must be between 1 and d - 1 = " + str(self._d - 1) + ", got " + str(layers))
+
+        ctx = self.secret_key_context(sk)
+        count, size = self.xmss_signatures_size(layers)
+        if self._xmss_signature_cache is None:
+            self.set_xmss_signature_cache(size)
+
+        for j, idx_tree, idx_leaf, sig_xmss, root, _ in self.upper_xmss_signatures(ctx, layers):
+            self._xmss_signature_cache.put((ctx.key_id, self._legacy_prf, j, idx_tree, idx_leaf),
+                                           (sig_xmss, root), self.xmss_signature_entry_size())
+
+        return {'layers': layers, 'signatures': count, 'bytes': size, 'cached': len(self._xmss_signature_cache)}
+
+    @parameter_change
+    def set_wots_chain_tables(self, cutoff, max_bytes=256 * 1024 * 1024):
+        """
+        Keep every value of the WOTS+ chains of the subtrees on layers cutoff to d - 1, signing with their leaves
+        becomes a lookup. A table takes 2 ** (h / d) * len_0 * w * n bytes (2.3 MB for n=16, w=16, h/d=8), it is
+        built the first time its subtree is used, least recently used ones are dropped above max_bytes
+        :param cutoff: lowest layer with tables, d - 1 for the top layer only, None disables them
+        """
+        self._chain_table_cutoff = cutoff
+        self._chain_tables = LRUCache(max_bytes) if cutoff is not None else None
+
+    def get_wots_chain_tables_stats(self):
+        """
+        :return: dict with entries, bytes, max_bytes, hits, misses, evictions and hit_rate, None when disabled
+        """
+        if self._chain_tables is None:
+            return None
+        return self._chain_tables.stats()
+
+    def wots_chain_table_size(self):
+        return 2 ** self._h_prime * self._len_0 * self._w * self._n
+
+    @operation
+    def save_wots_chain_table(self, path, sk, layer=None, tree=0):
+        """
+        Save the chain table of a subtree, built unless already kept, to be mapped by load_wots_chain_table.
+        The file holds WOTS+ secret values and is created readable by its owner only
+        :param sk: Secret Key, or its KeyContext
+        :param layer: layer of the subtree, the top layer when None
+        :param tree: tree address of the subtree
+        :return: ChainTable
+        """
+        ctx = self.secret_key_context(sk)
+        if layer is None:
+            layer = self._d - 1
+
+        table = None
+        if self._chain_tables is not None:
+            table = self._chain_tables.get((ctx.key_id, self._legacy_prf, layer, tree))
+        if table is None:
+            table = self.build_wots_chain_table(ctx, layer, tree)
+
+        # A table built during keygen does not know PK.root yet
+        table.public_key = ctx.public_key()
+        table.save(path)
+        return table
+
+    @parameter_change
+    def load_wots_chain_table(self, path, sk):
+        """
+        Map a chain table saved by save_wots_chain_table read-only and sign with it, chain tables are enabled
+        down to its layer
+        :param sk: Secret Key, or its KeyContext, the table was made for
+        :return: ChainTable
+        """
+        ctx = self.secret_key_context(sk)
+        table = ChainTable.load(path)
+        if table.public_key != ctx.public_key() or table.params != self.tree_params() or \
+                table.suite_name != ctx.suite.name or table.len_0 != self._len_0:
+            table.close()
+            raise ValueError("Chain table " + path + " belongs to another key, hash suite or parameters")
+
+        if self._chain_tables is None:
+            self.set_wots_chain_tables(table.layer)
+        self._chain_table_cutoff = min(self._chain_table_cutoff, table.layer)
+        self._chain_tables.put((ctx.key_id, self._legacy_prf, table.layer, table.tree), table, table.size)
+        return table
+
+    def settings(self):
+        """
+        :return: Parameters of this instance, immutable, apply_settings or the constructor give them to another one
+        """
+        return Parameters(self._n, self._w, self._h, self._d, self._k, self._a, self._randomize, self._legacy_prf,
+                          self._hash_suite)
+
+    @parameter_change
+    def apply_settings(self, settings):
+        """
+        Change every parameter at once
+        :param settings: Parameters, or a dict with the same fields
+        """
+        if isinstance(settings, dict):
+            settings = Parameters(**settings)
+        self._n = settings.n
+        self._w = settings.w
+        self._h = settings.h
+        self._d = settings.d
+        self._k = settings.k
+        self._a = settings.a
+        self._randomize = settings.randomize
+        self._legacy_prf = settings.legacy_prf
+        self._hash_suite = get_hash_suite(settings.hash_suite).name
+        self.calculate_variables()
+
+    def worker_pool(self, ctx, workers, settings=None):
+        """
+        Process pool whose workers hold an instance with the settings of this one and the key of CTX (when not
+        None), given once by the pool initializer instead of with every task
+        :param settings: Parameters of the workers when not the current ones of this instance
+        :return: ProcessPoolExecutor
+        """
+        key = None if ctx is None else (ctx.secret_seed, ctx.secret_prf, ctx.public_seed, ctx.public_root)
+        if settings is None:
+            settings = self.settings()
+        return ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(settings, key))
+
+    @parameter_change
+    def open_node_store(self, path, key, layers=2, readonly=False):
+        """
+        Keep the subtrees of the top layers of a key in a memory-mapped file, filled as signatures build them,
+        so that restarted or other processes signing with the same key start with them. The file is bound to
+        PK.root, the hash suite and the parameters of this instance
+        :param path: file of the store, created when missing
+        :param key: public key, or KeyContext of the secret or public key
+        :param layers: number of top layers stored when the file is created, layer d - 1 - i takes
+        2 ** (i * h / d) * (2 ** (h / d + 1) - 1) * n bytes
+        :param readonly: only read the subtrees already stored
+        :return: NodeStore, also used by this instance until set_node_store(None)
+        """
+        ctx = self.public_key_context(key) if not isinstance(key, KeyContext) else key
+        self.check_key_context(ctx)
+        store = NodeStore(path, ctx.public_key(), self.tree_params(), ctx.suite.name, layers, readonly)
+        self.set_node_store(store)
+        return store
+
+    @parameter_change
+    def set_node_store(self, store):
+        self._node_store = store
+
+    def get_node_store(self):
+        return self._node_store
+
+    def get_node_cache(self):
+        return self._node_cache
+
+    def get_node_cache_stats(self):
+        """
+        :return: dict with entries, bytes, max_bytes, hits, misses, evictions and hit_rate, None when disabled
+        """
+        if self._node_cache is None:
+            return None
+        return self._node_cache.stats()
+
     # UTILS
     # =================================================
 
+    def prf(self, ctx, adrs: ADRS):
+        if self._legacy_prf:
+            return prf_legacy(ctx.secret_seed, adrs, self._n)
+        return ctx.prf(adrs)
+
+    # Input: key context CTX, OptRand, MessageSource M
+    # Output: randomizer R, M is read once
+    def prf_msg(self, ctx, opt, m: MessageSource):
+        if self._legacy_prf:
+            legacy = Sha256Suite(self._n, b'0')
+            state = legacy.hash_msg_init(b'0', b'0')
+            for chunk in m.chunks():
+                state.update(chunk)
+            return prf_msg_legacy(ctx.secret_prf, opt, legacy.hash_msg_final(b'0', state, 2 * self._n), self._n)
+
+        state = ctx.prf_msg_init(opt)
+        for chunk in m.chunks():
+            state.update(chunk)
+        return ctx.prf_msg_final(state)
+
+    # Input: key context CTX, randomizer R, MessageSource M, output length
+    # Output: message digest, M is read once
+    def hash_msg(self, ctx, r, m: MessageSource, digest_size):
+        state = ctx.hash_msg_init(r)
+        for chunk in m.chunks():
+            state.update(chunk)
+        return ctx.hash_msg_final(r, state, digest_size)
+
     def sig_wots_from_sig_xmss(self, sig):
         return sig[0:self._len_0]
 
@@ -282,52 +1058,94 @@ class Sphincs():
     # WOTS+
     # =================================================
 
-    # Input: Input string X, start index i, number of steps s, public seed PK.seed, address ADRS
+    # Input: Input string X, start index i, number of steps s, key context CTX, address ADRS
     # Output: value of F iterated s times on X
-    def chain(self, x, i, s, public_seed, adrs: ADRS):
-        if s == 0:
-            return bytes(x)
-
+    def chain(self, x, i, s, ctx, adrs: ADRS):
         if (i + s) > (self._w - 1):
             return -1
 
-        tmp = self.chain(x, i, s - 1, public_seed, adrs)
-
-        adrs.set_hash_address(i + s - 1)
-        tmp = hash(public_seed, adrs, tmp, self._n)
+        tmp = bytes(x)
+        for j in range(i, i + s):
+            adrs.set_hash_address(j)
+            tmp = ctx.hash(adrs, tmp)
 
         return tmp
 
-    # Input: secret seed SK.seed, address ADRS
-    # Output: WOTS+ private key sk
-    def wots_sk_gen(self, secret_seed, adrs: ADRS):  # Not necessary
-        sk = []
-        for i in range(0, self._len_0):
-            adrs.set_chain_address(i)
-            adrs.set_hash_address(0)
-            sk.append(prf(secret_seed, adrs.copy(), self._n))
-        return sk
+    # Input: Input strings X_c, start indexes, numbers of steps, key context CTX, address ADRS
+    # Output: buffer holding the end of every chain, values kept at the checkpoints of each chain
+    def chains(self, xs, starts, steps, ctx, adrs: ADRS, out=None, checkpoints=None):
+        """
+        Iterate F over several WOTS+ chains at once, chain c using chain address c
+        :param out: bytearray receiving the end of chain c at [c * n:(c + 1) * n], allocated when None
+        :param checkpoints: checkpoints[c] holds the positions of chain c whose value must be kept
+        :return: out, list of dicts position -> value for each chain (None without checkpoints)
+        """
+        if out is None:
+            out = bytearray(len(xs) * self._n)
+        kept = None if checkpoints is None else [{} for _ in range(0, len(xs))]
+
+        for c in range(0, len(xs)):
+            adrs.set_chain_address(c)
+            tmp = bytes(xs[c])
+            keep = None if checkpoints is None else checkpoints[c]
+
+            if keep is not None and starts[c] in keep:
+                kept[c][starts[c]] = tmp
+            for j in range(starts[c], starts[c] + steps[c]):
+                adrs.set_hash_address(j)
+                tmp = ctx.hash(adrs, tmp)
+                if keep is not None and j + 1 in keep:
+                    kept[c][j + 1] = tmp
+
+            out[c * self._n:(c + 1) * self._n] = tmp
+
+        return out, kept
+
+    # Input: key context CTX, address ADRS of a WOTS+ key pair
+    # Output: chain table of the subtree holding it, built when missing, None when its layer has no tables
+    def wots_chain_table(self, ctx, adrs: ADRS):
+        if self._chain_tables is None or not ctx.has_secret() or \
+                adrs.get_layer_address() < self._chain_table_cutoff:
+            return None
+
+        key = (ctx.key_id, self._legacy_prf, adrs.get_layer_address(), adrs.get_tree_address())
+        table = self._chain_tables.get(key)
+        if table is None:
+            # A table the budget cannot keep would be rebuilt for every leaf
+            if self.wots_chain_table_size() > self._chain_tables.max_bytes:
+                return None
+            table = self.build_wots_chain_table(ctx, adrs.get_layer_address(), adrs.get_tree_address())
+            self._chain_tables.put(key, table, table.size)
+
+        return table
+
+    # Input: key context CTX, layer address, tree address
+    # Output: chain table holding every value of the WOTS+ chains of the subtree
+    def build_wots_chain_table(self, ctx, layer, tree):
+        table = ChainTable(ctx.public_key(), self.tree_params(), ctx.suite.name, self._len_0, layer, tree)
 
-    # Input: secret seed SK.seed, address ADRS, public seed PK.seed
-    # Output: WOTS+ public key pk
-    def wots_pk_gen(self, secret_seed, public_seed, adrs: ADRS):
-        wots_pk_adrs = adrs.copy()
-        tmp = bytes()
-        for i in range(0, self._len_0):
-            adrs.set_chain_address(i)
-            adrs.set_hash_address(0)
-            sk = prf(secret_seed, adrs.copy(), self._n)
-            tmp += bytes(self.chain(sk, 0, self._w - 1, public_seed, adrs.copy()))
+        adrs = ADRS()
+        adrs.set_layer_address(layer)
+        adrs.set_tree_address(tree)
+        adrs.set_type(ADRS.WOTS_HASH)
 
-        wots_pk_adrs.set_type(ADRS.WOTS_PK)
-        wots_pk_adrs.set_key_pair_address(adrs.get_key_pair_address())
+        positions = range(0, self._w)
+        checkpoints = [positions] * self._len_0
 
-        pk = hash(public_seed, wots_pk_adrs, tmp, self._n)
-        return pk
+        for leaf in range(0, table.leaves):
+            adrs.set_key_pair_address(leaf)
+            sk = self.wots_sk_gen(ctx, adrs)
+            _, kept = self.chains(sk, [0] * self._len_0, [self._w - 1] * self._len_0, ctx, adrs,
+                                  checkpoints=checkpoints)
 
-    # Input: Message M, secret seed SK.seed, public seed PK.seed, address ADRS
-    # Output: WOTS+ signature sig
-    def wots_sign(self, m, secret_seed, public_seed, adrs):
+            for c in range(0, self._len_0):
+                table.set_chain(leaf, c, [kept[c][pos] for pos in positions])
+
+        return table
+
+    # Input: n-byte message M
+    # Output: base w message with its checksum, one chain position for each chain
+    def wots_msg(self, m):
         csum = 0
 
         msg = base_w(m, self._w, self._len_1)
@@ -341,55 +1159,103 @@ class Sphincs():
         csumw = base_w(csumb, self._w, self._len_2)
         msg += csumw
 
-        sig = []
+        return msg
+
+    # Input: key context CTX, address ADRS
+    # Output: WOTS+ private key sk
+    def wots_sk_gen(self, ctx, adrs: ADRS):  # Not necessary
+        sk = []
         for i in range(0, self._len_0):
             adrs.set_chain_address(i)
             adrs.set_hash_address(0)
-            sk = prf(secret_seed, adrs.copy(), self._n)
-            sig += [self.chain(sk, 0, msg[i], public_seed, adrs.copy())]
+            sk.append(self.prf(ctx, adrs))
+        return sk
 
-        return sig
+    # Input: key context CTX, address ADRS
+    # Output: WOTS+ public key pk
+    def wots_pk_gen(self, ctx, adrs: ADRS):
+        pk, _ = self.wots_pk_and_sign(None, ctx, adrs)
+        return pk
 
-    def wots_pk_from_sig(self, sig, m, public_seed, adrs: ADRS):
-        csum = 0
+    # Input: Message M (or None), key context CTX, address ADRS
+    # Output: WOTS+ public key pk, WOTS+ signature sig of M read on the way up the chains (or None)
+    def wots_pk_and_sign(self, m, ctx, adrs: ADRS):
         wots_pk_adrs = adrs.copy()
 
-        msg = base_w(m, self._w, self._len_1)
+        table = self.wots_chain_table(ctx, adrs)
+        if table is not None:
+            leaf = adrs.get_key_pair_address()
+            wots_pk_adrs.set_type(ADRS.WOTS_PK)
+            wots_pk_adrs.set_key_pair_address(leaf)
 
-        for i in range(0, self._len_1):
-            csum += self._w - 1 - msg[i]
+            pk = ctx.hash(wots_pk_adrs, table.ends(leaf))
+            sig = None if m is None else table.signature(leaf, self.wots_msg(m))
+            return pk, sig
 
-        padding = (self._len_2 * math.floor(math.log(self._w, 2))) % 8 if (self._len_2 * math.floor(math.log(self._w, 2))) % 8 != 0 else 8
-        csum = csum << (8 - padding)
-        csumb = csum.to_bytes(math.ceil((self._len_2 * math.floor(math.log(self._w, 2))) / 8), byteorder='big')
-        csumw = base_w(csumb, self._w, self._len_2)
-        msg += csumw
+        sk = self.wots_sk_gen(ctx, adrs)
 
-        tmp = bytes()
-        for i in range(0, self._len_0):
-            adrs.set_chain_address(i)
-            tmp += self.chain(sig[i], msg[i], self._w - 1 - msg[i], public_seed, adrs.copy())
+        checkpoints = None
+        if m is not None:
+            checkpoints = [(pos,) for pos in self.wots_msg(m)]
+
+        tmp, kept = self.chains(sk, [0] * self._len_0, [self._w - 1] * self._len_0, ctx, adrs,
+                                checkpoints=checkpoints)
+
+        wots_pk_adrs.set_type(ADRS.WOTS_PK)
+        wots_pk_adrs.set_key_pair_address(adrs.get_key_pair_address())
+
+        pk = ctx.hash(wots_pk_adrs, tmp)
+        sig = None if kept is None else [kept[i][checkpoints[i][0]] for i in range(0, self._len_0)]
+        return pk, sig
+
+    # Input: Message M, key context CTX, address ADRS
+    # Output: WOTS+ signature sig
+    def wots_sign(self, m, ctx, adrs):
+        msg = self.wots_msg(m)
+
+        table = self.wots_chain_table(ctx, adrs)
+        if table is not None:
+            return table.signature(adrs.get_key_pair_address(), msg)
+
+        sk = self.wots_sk_gen(ctx, adrs)
+
+        tmp, _ = self.chains(sk, [0] * self._len_0, msg, ctx, adrs)
+
+        sig = [bytes(tmp[i * self._n:(i + 1) * self._n]) for i in range(0, self._len_0)]
+        return sig
+
+    def wots_pk_from_sig(self, sig, m, ctx, adrs: ADRS):
+        wots_pk_adrs = adrs.copy()
+
+        msg = self.wots_msg(m)
+
+        tmp, _ = self.chains(sig, msg, [self._w - 1 - msg[i] for i in range(0, self._len_0)], ctx, adrs)
 
         wots_pk_adrs.set_type(ADRS.WOTS_PK)
         wots_pk_adrs.set_key_pair_address(adrs.get_key_pair_address())
-        pk_sig = hash(public_seed, wots_pk_adrs, tmp, self._n)
+        pk_sig = ctx.hash(wots_pk_adrs, tmp)
         return pk_sig
 
     # XMSS
     # =================================================
 
-    # Input: Secret seed SK.seed, start index s, target node height z, public seed PK.seed, address ADRS
+    # Input: Key context CTX, start index s, target node height z, address ADRS
     # Output: n-byte root node - top node on Stack
-    def treehash(self, secret_seed, s, z, public_seed, adrs: ADRS):
+    def treehash(self, s, z, ctx, adrs: ADRS):
         if s % (1 << z) != 0:
             return -1
 
+        levels = self.cached_subtree(ctx, adrs)
+        if levels is not None and len(levels[z]) > 0:
+            index = s >> z
+            return levels[z][index * self._n:(index + 1) * self._n]
+
         stack = []
 
         for i in range(0, 2 ** z):
             adrs.set_type(ADRS.WOTS_HASH)
             adrs.set_key_pair_address(s + i)
-            node = self.wots_pk_gen(secret_seed, public_seed, adrs.copy())
+            node = self.wots_pk_gen(ctx, adrs)
 
             adrs.set_type(ADRS.TREE)
             adrs.set_tree_height(1)
@@ -398,7 +1264,7 @@ class Sphincs():
             if len(stack) > 0:
                 while stack[len(stack) - 1]['height'] == adrs.get_tree_height():
                     adrs.set_tree_index((adrs.get_tree_index() - 1) // 2)
-                    node = hash(public_seed, adrs.copy(), stack.pop()['node'] + node, self._n)
+                    node = ctx.hash(adrs, stack.pop()['node'] + node)
                     adrs.set_tree_height(adrs.get_tree_height() + 1)
 
                     if len(stack) <= 0:
@@ -408,41 +1274,198 @@ class Sphincs():
 
         return stack.pop()['node']
 
-    # Input: Secret seed SK.seed, public seed PK.seed, address ADRS
+    # Input: Key context CTX, address ADRS
     # Output: XMSS public key PK
-    def xmss_pk_gen(self, secret_seed, public_key, adrs: ADRS):
-        pk = self.treehash(secret_seed, 0, self._h_prime, public_key, adrs.copy())
+    def xmss_pk_gen(self, ctx, adrs: ADRS):
+        pk = self.treehash(0, self._h_prime, ctx, adrs.copy())
         return pk
 
-    # Input: n-byte message M, secret seed SK.seed, index idx, public seed PK.seed, address ADRS
-    # Output: XMSS signature SIG_XMSS = (sig || AUTH)
-    def xmss_sign(self, m, secret_seed, idx, public_seed, adrs):
-        auth = []
-        for j in range(0, self._h_prime):
-            ki = math.floor(idx // 2 ** j)
-            if ki % 2 == 1:  # XORING idx/ 2**j with 1
-                ki -= 1
+    # Input: n-byte message M (or None), key context CTX, index idx, address ADRS
+    # Output: root node, AUTH path of leaf idx, WOTS+ signature of M with leaf idx, every node by height (or None)
+    def xmss_subtree(self, m, idx, ctx, adrs: ADRS, keep_nodes=False):
+        """
+        Build the whole XMSS subtree in a single bottom-up traversal, picking the authentication path of
+        leaf idx on the way and signing M with the WOTS+ key of that leaf when it is reached
+        :param m: n-byte message signed by leaf idx, None to skip the WOTS+ signature
+        :param keep_nodes: also return every node of the subtree, nodes[height][index]
+        :return: root, auth, sig, nodes
+        """
+        levels = self.cached_subtree(ctx, adrs)
+        # Levels cut by the traversal mode cannot give every node
+        if levels is not None and (not keep_nodes or len(levels[0]) > 0):
+            return self.xmss_subtree_from_levels(m, idx, ctx, adrs, levels, keep_nodes)
+
+        cache = self.keeps_subtree(ctx, adrs)
+        root, auth, sig, nodes = self.xmss_traverse(m, idx, ctx, adrs, 0, self._h_prime, keep_nodes or cache)
+
+        if cache:
+            self.keep_subtree(ctx, adrs, tuple(b''.join(level) for level in nodes))
+            if not keep_nodes:
+                nodes = None
+
+        return root, auth, sig, nodes
+
+    # Input: n-byte message M (or None), key context CTX, index idx, address ADRS, first leaf, height of the part
+    # Output: root of the part, AUTH path of leaf idx up to that height, WOTS+ signature of M, nodes (or None)
+    def xmss_traverse(self, m, idx, ctx, adrs: ADRS, start, part_height, keep_nodes=False):
+        """
+        Bottom-up traversal of the 2 ** part_height leaves from start, the whole subtree when start is 0 and
+        part_height is h'. Leaf idx is one of them when M is signed or the path is needed
+        """
+        auth = [bytes()] * part_height
+        nodes = [[] for _ in range(0, part_height + 1)] if keep_nodes else None
+        sig = None
+
+        leaf_adrs = adrs.copy()
+        leaf_adrs.set_type(ADRS.WOTS_HASH)
+        node_adrs = adrs.copy()
+        node_adrs.set_type(ADRS.TREE)
+
+        stack = []
+
+        for i in range(start, start + 2 ** part_height):
+            leaf_adrs.set_key_pair_address(i)
+            if i == idx and m is not None:
+                node, sig = self.wots_pk_and_sign(m, ctx, leaf_adrs)
             else:
-                ki += 1
+                node = self.wots_pk_gen(ctx, leaf_adrs)
+            height = 0
+            index = i
 
-            auth += [self.treehash(secret_seed, ki * 2 ** j, j, public_seed, adrs.copy())]
+            while True:
+                if nodes is not None:
+                    nodes[height].append(node)
+                if height < part_height and index == (idx >> height) ^ 1:
+                    auth[height] = node
 
-        adrs.set_type(ADRS.WOTS_HASH)
-        adrs.set_key_pair_address(idx)
+                if len(stack) == 0 or stack[len(stack) - 1][1] != height:
+                    break
 
-        sig = self.wots_sign(m, secret_seed, public_seed, adrs.copy())
+                height += 1
+                index = index // 2
+                node_adrs.set_tree_height(height)
+                node_adrs.set_tree_index(index)
+                node = ctx.hash(node_adrs, stack.pop()[0] + node)
+
+            stack.append((node, height))
+
+        return stack.pop()[0], auth, sig, nodes
+
+    # Input: n-byte message M (or None), key context CTX, index idx, address ADRS, levels of the subtree
+    # Output: same as xmss_subtree, only the WOTS+ signature of leaf idx is computed
+    def xmss_subtree_from_levels(self, m, idx, ctx, adrs: ADRS, levels, keep_nodes=False):
+        n = self._n
+
+        # Levels under the cut of the traversal mode are empty, the part of the subtree holding leaf idx is rebuilt
+        cut = 0
+        while len(levels[cut]) == 0:
+            cut += 1
+
+        sig = None
+        auth = []
+        if cut > 0:
+            _, auth, sig, _ = self.xmss_traverse(m, idx, ctx, adrs, (idx >> cut) << cut, cut)
+
+        for height in range(cut, self._h_prime):
+            sibling = (idx >> height) ^ 1
+            auth.append(levels[height][sibling * n:(sibling + 1) * n])
+
+        if m is not None and sig is None:
+            leaf_adrs = adrs.copy()
+            leaf_adrs.set_type(ADRS.WOTS_HASH)
+            leaf_adrs.set_key_pair_address(idx)
+            sig = self.wots_sign(m, ctx, leaf_adrs)
+
+        nodes = None
+        if keep_nodes:
+            nodes = [[level[i:i + n] for i in range(0, len(level), n)] for level in levels]
+
+        return levels[self._h_prime], auth, sig, nodes
+
+    # Input: key context CTX, address ADRS of a subtree
+    # Output: key of the subtree in the node cache, the PRF mode changes every node
+    def node_cache_key(self, ctx, adrs: ADRS):
+        # Every parameter the nodes depend on, processes sharing a cache may sign with other ones
+        return ctx.key_id, self.tree_params(), self._hash_suite, adrs.get_layer_address(), adrs.get_tree_address()
+
+    # Input: key context CTX, address ADRS of a subtree
+    # Output: nodes of the subtree concatenated by height, None when not cached
+    def cached_subtree(self, ctx, adrs: ADRS):
+        # Parameters read before the tree, build_top_tree writes them after it
+        if adrs.get_layer_address() == self._d - 1 and ctx.top_tree_params == self.tree_params():
+            top_tree = ctx.top_tree
+            if top_tree is not None:
+                return top_tree
+
+        if not ctx.has_secret():
+            return None
+
+        if self._node_cache is not None:
+            levels = self._node_cache.get(self.node_cache_key(ctx, adrs))
+            if levels is not None:
+                return levels
+
+        store = self.node_store_for(ctx)
+        if store is None:
+            return None
+
+        levels = store.get(adrs.get_layer_address(), adrs.get_tree_address())
+        if levels is not None and self._node_cache is not None:
+            self.node_cache_put(ctx, adrs, levels)
+        return levels
+
+    # Input: key context CTX, address ADRS of a subtree, its nodes concatenated by height
+    def node_cache_put(self, ctx, adrs: ADRS, levels):
+        # The traversal mode only keeps the levels from its cut height
+        levels = tuple(bytes() if height < self._traversal_cut else level for height, level in enumerate(levels))
+        self._node_cache.put(self.node_cache_key(ctx, adrs), levels, sum(len(level) for level in levels))
+
+    # Input: key context CTX, address ADRS of a subtree
+    # Output: Boolean, True when the nodes of the subtree are worth keeping once built
+    def keeps_subtree(self, ctx, adrs: ADRS):
+        if not ctx.has_secret():
+            return False
+        if self._node_cache is not None:
+            return True
+
+        store = self.node_store_for(ctx)
+        return store is not None and not store.readonly and \
+            store.holds(adrs.get_layer_address(), adrs.get_tree_address())
+
+    # Input: key context CTX, address ADRS of a subtree, its nodes concatenated by height
+    def keep_subtree(self, ctx, adrs: ADRS, levels):
+        if self._node_cache is not None:
+            self.node_cache_put(ctx, adrs, levels)
+
+        store = self.node_store_for(ctx)
+        if store is not None:
+            store.put(adrs.get_layer_address(), adrs.get_tree_address(), levels)
+
+    # Input: key context CTX
+    # Output: node store holding the subtrees of CTX with the parameters of this instance, None otherwise
+    def node_store_for(self, ctx):
+        store = self._node_store
+        if store is None or store.public_key != ctx.public_seed + ctx.public_root or \
+                store.params != self.tree_params() or store.suite_name != ctx.suite.name:
+            return None
+        return store
+
+    # Input: n-byte message M, key context CTX, index idx, address ADRS
+    # Output: XMSS signature SIG_XMSS = (sig || AUTH)
+    def xmss_sign(self, m, idx, ctx, adrs):
+        root, auth, sig, _ = self.xmss_subtree(m, idx, ctx, adrs)
         sig_xmss = sig + auth
         return sig_xmss
 
-    # Input: index idx, XMSS signature SIG_XMSS = (sig || AUTH), n-byte message M, public seed PK.seed, address ADRS
+    # Input: index idx, XMSS signature SIG_XMSS = (sig || AUTH), n-byte message M, key context CTX, address ADRS
     # Output: n-byte root value node[0]
-    def xmss_pk_from_sig(self, idx, sig_xmss, m, public_seed, adrs):
+    def xmss_pk_from_sig(self, idx, sig_xmss, m, ctx, adrs):
         adrs.set_type(ADRS.WOTS_HASH)
         adrs.set_key_pair_address(idx)
         sig = self.sig_wots_from_sig_xmss(sig_xmss)
         auth = self.auth_from_sig_xmss(sig_xmss)
 
-        node_0 = self.wots_pk_from_sig(sig, m, public_seed, adrs.copy())
+        node_0 = self.wots_pk_from_sig(sig, m, ctx, adrs.copy())
         node_1 = 0
 
         adrs.set_type(ADRS.TREE)
@@ -452,10 +1475,10 @@ class Sphincs():
 
             if math.floor(idx / 2 ** i) % 2 == 0:
                 adrs.set_tree_index(adrs.get_tree_index() // 2)
-                node_1 = hash(public_seed, adrs.copy(), node_0 + auth[i], self._n)
+                node_1 = ctx.hash(adrs, node_0 + auth[i])
             else:
                 adrs.set_tree_index((adrs.get_tree_index() - 1) // 2)
-                node_1 = hash(public_seed, adrs.copy(), auth[i] + node_0, self._n)
+                node_1 = ctx.hash(adrs, bytes(auth[i]) + node_0)
 
             node_0 = node_1
 
@@ -464,44 +1487,277 @@ class Sphincs():
     # HYPERTREE XMSS
     # =================================================
 
-    # Input: Private seed SK.seed, public seed PK.seed
+    # Input: Key context CTX
     # Output: HT public key PK_HT
-    def ht_pk_gen(self, secret_seed, public_seed):
+    def ht_pk_gen(self, ctx):
         adrs = ADRS()
         adrs.set_layer_address(self._d - 1)
         adrs.set_tree_address(0)
-        root = self.xmss_pk_gen(secret_seed, public_seed, adrs.copy())
+        root = self.xmss_pk_gen(ctx, adrs.copy())
         return root
 
-    # Input: Message M, private seed SK.seed, public seed PK.seed, tree index idx_tree, leaf index idx_leaf
-    # Output: HT signature SIG_HT
-    def ht_sign(self, m, secret_seed, public_seed, idx_tree, idx_leaf):
+    # Input: Key context CTX
+    # Output: HT public key PK_HT, every node of the top layer tree is kept in CTX
+    def build_top_tree(self, ctx):
         adrs = ADRS()
-        adrs.set_layer_address(0)
-        adrs.set_tree_address(idx_tree)
+        adrs.set_layer_address(self._d - 1)
+        adrs.set_tree_address(0)
 
-        sig_tmp = self.xmss_sign(m, secret_seed, idx_leaf, public_seed, adrs.copy())
-        sig_ht = sig_tmp
-        root = self.xmss_pk_from_sig(idx_leaf, sig_tmp, m, public_seed, adrs.copy())
+        ctx.top_tree_params = None
+        ctx.top_tree = None
+        root, _, _, nodes = self.xmss_subtree(None, 0, ctx, adrs, keep_nodes=True)
+        ctx.top_tree = tuple(b''.join(level) for level in nodes)
+        ctx.top_tree_params = self.tree_params()
 
-        for j in range(1, self._d):
-            idx_leaf = idx_tree % 2 ** self._h_prime
-            idx_tree = idx_tree >> self._h_prime
+        return root
+
+    # Input: worker pool, number of workers, key context CTX, layer address, tree address
+    # Output: root of the subtree, its nodes concatenated by height (or None)
+    def parallel_subtree(self, pool, workers, ctx, layer, tree, keep_nodes=False):
+        """
+        Workers build parts of the subtree holding consecutive leaves, the roots of the parts are combined here
+        """
+        # A few parts per worker even out their running times
+        part_height = self._h_prime
+        while part_height > 0 and 2 ** (self._h_prime - part_height) < 4 * workers:
+            part_height -= 1
+
+        parts = [pool.submit(worker_subtree_part, layer, tree, start, part_height, keep_nodes)
+                 for start in range(0, 2 ** self._h_prime, 2 ** part_height)]
+        parts = [part.result() for part in parts]
 
+        roots = [root for root, _ in parts]
+        levels = None
+        if keep_nodes:
+            levels = [b''.join(nodes[height] for _, nodes in parts) for height in range(0, part_height + 1)]
+
+        adrs = ADRS()
+        adrs.set_layer_address(layer)
+        adrs.set_tree_address(tree)
+        adrs.set_type(ADRS.TREE)
+        for height in range(part_height + 1, self._h_prime + 1):
+            adrs.set_tree_height(height)
+            above = []
+            for index in range(0, len(roots) // 2):
+                adrs.set_tree_index(index)
+                above.append(ctx.hash(adrs, roots[2 * index] + roots[2 * index + 1]))
+            roots = above
+            if keep_nodes:
+                levels.append(b''.join(roots))
+
+        return roots[0], None if levels is None else tuple(levels)
+
+    # Input: Key context CTX, number of top layers
+    # Output: every XMSS signature of these layers, bottom-up, as
+    # (layer, tree address, leaf, SIG_XMSS, root of the subtree, root signed)
+    def upper_xmss_signatures(self, ctx, layers):
+        adrs = ADRS()
+        child_adrs = ADRS()
+        # Bottom-up, the roots of a layer are the messages signed by the layer above
+        child_roots = None
+        for j in range(self._d - layers, self._d):
+            adrs.set_layer_address(j)
+            child_adrs.set_layer_address(j - 1)
+            roots = []
+
+            for idx_tree in range(0, 2 ** ((self._d - 1 - j) * self._h_prime)):
+                adrs.set_tree_address(idx_tree)
+                root, _, _, nodes = self.xmss_subtree(None, 0, ctx, adrs, keep_nodes=True)
+                levels = tuple(b''.join(level) for level in nodes)
+
+                for idx_leaf in range(0, 2 ** self._h_prime):
+                    child = (idx_tree << self._h_prime) | idx_leaf
+                    if child_roots is None:
+                        child_adrs.set_tree_address(child)
+                        child_root, _, _, _ = self.xmss_subtree(None, 0, ctx, child_adrs)
+                    else:
+                        child_root = child_roots[child]
+
+                    _, auth, sig, _ = self.xmss_subtree_from_levels(child_root, idx_leaf, ctx, adrs, levels)
+                    yield j, idx_tree, idx_leaf, sig + auth, root, child_root
+
+                roots.append(root)
+            child_roots = roots
+
+    # Input: Key context CTX, first leaf, treehash stack of the leaves before it, checkpoint file
+    # Output: secret key and public key
+    def checkpointed_keygen(self, ctx, start, stack, path):
+        """
+        Top layer treehash saving its stack and next leaf to path, the only state of key generation besides the seeds
+        """
+        adrs = ADRS()
+        adrs.set_layer_address(self._d - 1)
+        adrs.set_tree_address(0)
+
+        leaf_adrs = adrs.copy()
+        leaf_adrs.set_type(ADRS.WOTS_HASH)
+        node_adrs = adrs.copy()
+        node_adrs.set_type(ADRS.TREE)
+
+        last = time.monotonic()
+        for i in range(start, 2 ** self._h_prime):
+            leaf_adrs.set_key_pair_address(i)
+            node = self.wots_pk_gen(ctx, leaf_adrs)
+            height = 0
+            index = i
+
+            while len(stack) > 0 and stack[len(stack) - 1][1] == height:
+                height += 1
+                index = index // 2
+                node_adrs.set_tree_height(height)
+                node_adrs.set_tree_index(index)
+                node = ctx.hash(node_adrs, stack.pop()[0] + node)
+
+            stack.append((node, height))
+
+            if time.monotonic() - last >= self._checkpoint_interval:
+                self.save_keygen_checkpoint(path, ctx, i + 1, stack)
+                last = time.monotonic()
+
+        ctx.public_root = stack.pop()[0]
+        if os.path.exists(path):
+            os.remove(path)
+
+        return ctx.secret_key(), ctx.public_key()
+
+    # Input: checkpoint file, key context CTX, next leaf, treehash stack
+    def save_keygen_checkpoint(self, path, ctx, next_leaf, stack):
+        n, w, h, d, legacy_prf = self.tree_params()
+        state = {
+            'version': 1,
+            'n': n, 'w': w, 'h': h, 'd': d, 'legacy_prf': legacy_prf, 'hash_suite': self._hash_suite,
+            'secret_seed': ctx.secret_seed.hex(),
+            'secret_prf': ctx.secret_prf.hex(),
+            'public_seed': ctx.public_seed.hex(),
+            'next_leaf': next_leaf,
+            'stack': [[node.hex(), height] for node, height in stack],
+        }
+
+        # Written aside then renamed, an interruption leaves the previous checkpoint whole
+        tmp_path = path + '.tmp'
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    # Input: Message M, key context CTX, tree index idx_tree, leaf index idx_leaf
+    # Output: HT signature SIG_HT
+    def ht_sign(self, m, ctx, idx_tree, idx_leaf):
+        sig_ht, _ = self.ht_sign_with_roots(m, ctx, idx_tree, idx_leaf)
+        return sig_ht
+
+    # Input: Message M, key context CTX, tree index idx_tree, leaf index idx_leaf
+    # Output: HT signature SIG_HT, root of the XMSS subtree used on each layer (the last one is PK.root)
+    def ht_sign_with_roots(self, m, ctx, idx_tree, idx_leaf):
+        """
+        The root of each subtree comes out of the traversal that builds its authentication path,
+        it is signed by the next layer without being recomputed from the signature
+        """
+        adrs = ADRS()
+        sig_ht = []
+        roots = []
+
+        for j in range(0, self._d):
             adrs.set_layer_address(j)
             adrs.set_tree_address(idx_tree)
 
-            sig_tmp = self.xmss_sign(root, secret_seed, idx_leaf, public_seed, adrs.copy())
-            sig_ht = sig_ht + sig_tmp
+            # Above layer 0 the signed root, hence the whole XMSS signature, only depends on idx_tree
+            key = None
+            if j > 0 and self._xmss_signature_cache is not None:
+                key = (ctx.key_id, self._legacy_prf, j, idx_tree, idx_leaf)
+                cached = self._xmss_signature_cache.get(key)
+                if cached is not None:
+                    sig_ht += cached[0]
+                    roots.append(cached[1])
 
-            if j < self._d - 1:
-                root = self.xmss_pk_from_sig(idx_leaf, sig_tmp, root, public_seed, adrs.copy())
+                    m = cached[1]
+                    idx_leaf = idx_tree % 2 ** self._h_prime
+                    idx_tree = idx_tree >> self._h_prime
+                    continue
 
-        return sig_ht
+            root, auth, sig, _ = self.xmss_subtree(m, idx_leaf, ctx, adrs)
+            sig_ht += sig + auth
+            roots.append(root)
 
-    # Input: Message M, signature SIG_HT, public seed PK.seed, tree index idx_tree, leaf index idx_leaf, HT public key PK_HT
-    # Output: Boolean
-    def ht_verify(self, m, sig_ht, public_seed, idx_tree, idx_leaf, public_key_ht):
+            if key is not None:
+                self._xmss_signature_cache.put(key, (sig + auth, root), self.xmss_signature_entry_size())
+
+            m = root
+            idx_leaf = idx_tree % 2 ** self._h_prime
+            idx_tree = idx_tree >> self._h_prime
+
+        return sig_ht, roots
+
+    # Input: list of (message M, tree index idx_tree, leaf index idx_leaf), key context CTX
+    # Output: HT signature SIG_HT of every message
+    def ht_sign_many(self, positions, ctx):
+        """
+        Layer by layer, the messages signed in the same subtree are grouped and the subtree is built once for
+        the group. Above layer 0 the XMSS signature only depends on the position, it is made once per position
+        """
+        sigs_ht = [[] for _ in positions]
+        adrs = ADRS()
+
+        for j in range(0, self._d):
+            adrs.set_layer_address(j)
+
+            # tree -> (leaf, message) -> indexes of the signatures
+            groups = {}
+            for i, (m, idx_tree, idx_leaf) in enumerate(positions):
+                groups.setdefault(idx_tree, {}).setdefault((idx_leaf, m), []).append(i)
+
+            next_positions = [None] * len(positions)
+            for idx_tree, signed in groups.items():
+                adrs.set_tree_address(idx_tree)
+                levels = None
+
+                for (idx_leaf, m), indexes in signed.items():
+                    key = None
+                    cached = None
+                    if j > 0 and self._xmss_signature_cache is not None:
+                        key = (ctx.key_id, self._legacy_prf, j, idx_tree, idx_leaf)
+                        cached = self._xmss_signature_cache.get(key)
+
+                    if cached is not None:
+                        sig_xmss, root = cached
+                    else:
+                        if len(signed) == 1:
+                            root, auth, sig, _ = self.xmss_subtree(m, idx_leaf, ctx, adrs)
+                        else:
+                            if levels is None:
+                                levels = self.whole_subtree(ctx, adrs)
+                            root, auth, sig, _ = self.xmss_subtree_from_levels(m, idx_leaf, ctx, adrs, levels)
+                        sig_xmss = sig + auth
+                        if key is not None:
+                            self._xmss_signature_cache.put(key, (sig_xmss, root), self.xmss_signature_entry_size())
+
+                    position = (root, idx_tree >> self._h_prime, idx_tree % 2 ** self._h_prime)
+                    for i in indexes:
+                        sigs_ht[i] += sig_xmss
+                        next_positions[i] = position
+
+            positions = next_positions
+
+        return sigs_ht
+
+    # Input: key context CTX, address ADRS of a subtree
+    # Output: nodes of the subtree concatenated by height, from the caches or built once
+    def whole_subtree(self, ctx, adrs: ADRS):
+        levels = self.cached_subtree(ctx, adrs)
+        if levels is not None:
+            return levels
+
+        _, _, _, nodes = self.xmss_traverse(None, -1, ctx, adrs, 0, self._h_prime, True)
+        levels = tuple(b''.join(level) for level in nodes)
+        if self.keeps_subtree(ctx, adrs):
+            self.keep_subtree(ctx, adrs, levels)
+        return levels
+
+    # Input: Message M, signature SIG_HT, key context CTX, tree index idx_tree, leaf index idx_leaf
+    # Output: Boolean, True when the hypertree leads to PK.root
+    def ht_verify(self, m, sig_ht, ctx, idx_tree, idx_leaf):
         adrs = ADRS()
 
         sigs_xmss = self.sigs_xmss_from_sig_ht(sig_ht)
@@ -509,7 +1765,13 @@ class Sphincs():
 
         adrs.set_layer_address(0)
         adrs.set_tree_address(idx_tree)
-        node = self.xmss_pk_from_sig(idx_leaf, sig_tmp, m, public_seed, adrs)
+        node = self.xmss_pk_from_sig(idx_leaf, sig_tmp, m, ctx, adrs)
+
+        # Roots reached on the way, remembered once the whole path is authenticated
+        reached = []
+        known = self.check_verified_root(ctx, 0, idx_tree, node, reached)
+        if known is not None:
+            return known
 
         for j in range(1, self._d):
             idx_leaf = idx_tree % 2 ** self._h_prime
@@ -520,28 +1782,77 @@ class Sphincs():
             adrs.set_layer_address(j)
             adrs.set_tree_address(idx_tree)
 
-            node = self.xmss_pk_from_sig(idx_leaf, sig_tmp, node, public_seed, adrs)
+            node = self.xmss_pk_from_sig(idx_leaf, sig_tmp, node, ctx, adrs)
+
+            if j < self._d - 1:
+                known = self.check_verified_root(ctx, j, idx_tree, node, reached)
+                if known is not None:
+                    return known
 
-        if node == public_key_ht:
+        if node == ctx.public_root:
+            self.keep_verified_roots(reached)
             return True
         else:
             return False
 
+    # Input: key context CTX, layer, tree address, root computed for that subtree, roots reached before it
+    # Output: Boolean when the root of the subtree is already authenticated, None when unknown
+    def check_verified_root(self, ctx, layer, tree, node, reached):
+        """
+        A subtree has a single genuine root: a signature reaching an authenticated one is valid from there up,
+        one reaching another value is not
+        """
+        snapshot = self.snapshot_for(ctx)
+        if snapshot is not None and snapshot.holds(layer):
+            if snapshot.root(layer, tree) != node:
+                return False
+            if self._root_cache is not None:
+                self.keep_verified_roots(reached)
+            return True
+
+        if self._root_cache is None:
+            return None
+
+        key = (ctx.key_id, layer, tree)
+        root = self._root_cache.get(key)
+        if root is None:
+            reached.append((key, node))
+            return None
+
+        if root != node:
+            return False
+        self.keep_verified_roots(reached)
+        return True
+
+    # Input: key context CTX
+    # Output: hypertree snapshot of CTX for the parameters of this instance, None otherwise
+    def snapshot_for(self, ctx):
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.public_key != ctx.public_seed + ctx.public_root or \
+                snapshot.params != self.tree_params()[:4] or snapshot.suite_name != ctx.suite.name:
+            return None
+        return snapshot
+
+    # Input: (key, root) pairs of a path authenticated up to PK.root or to a root authenticated before
+    def keep_verified_roots(self, reached):
+        for key, node in reached:
+            self._root_cache.put(key, node, len(node))
+
     # FORS
     # =================================================
 
-    # Input: secret seed SK.seed, address ADRS, secret key index idx = it+j
+    # Input: key context CTX, address ADRS, secret key index idx = it+j
     # Output: FORS private key sk
-    def fors_sk_gen(self, secret_seed, adrs: ADRS, idx):
+    def fors_sk_gen(self, ctx, adrs: ADRS, idx):
         adrs.set_tree_height(0)
         adrs.set_tree_index(idx)
-        sk = prf(secret_seed, adrs.copy(), self._n)
+        sk = self.prf(ctx, adrs)
 
         return sk
 
-    # Input: Secret seed SK.seed, start index s, target node height z, public seed PK.seed, address ADRS
+    # Input: Key context CTX, start index s, target node height z, address ADRS
     # Output: n-byte root node - top node on Stack
-    def fors_treehash(self, secret_seed, s, z, public_seed, adrs):
+    def fors_treehash(self, s, z, ctx, adrs):
         if s % (1 << z) != 0:
             return -1
 
@@ -550,15 +1861,15 @@ class Sphincs():
         for i in range(0, 2 ** z):
             adrs.set_tree_height(0)
             adrs.set_tree_index(s + i)
-            sk = prf(secret_seed, adrs.copy(), self._n)
-            node = hash(public_seed, adrs.copy(), sk, self._n)
+            sk = self.prf(ctx, adrs)
+            node = ctx.hash(adrs, sk)
 
             adrs.set_tree_height(1)
             adrs.set_tree_index(s + i)
             if len(stack) > 0:
                 while stack[len(stack) - 1]['height'] == adrs.get_tree_height():
                     adrs.set_tree_index((adrs.get_tree_index() - 1) // 2)
-                    node = hash(public_seed, adrs.copy(), stack.pop()['node'] + node, self._n)
+                    node = ctx.hash(adrs, stack.pop()['node'] + node)
 
                     adrs.set_tree_height(adrs.get_tree_height() + 1)
 
@@ -568,51 +1879,87 @@ class Sphincs():
 
         return stack.pop()['node']
 
-    # Input: Secret seed SK.seed, public seed PK.seed, address ADRS
+    # Input: Key context CTX, address ADRS
     # Output: FORS public key PK
-    def fors_pk_gen(self, secret_seed, public_seed, adrs: ADRS):
+    def fors_pk_gen(self, ctx, adrs: ADRS):
         fors_pk_adrs = adrs.copy()
 
         root = bytes()
         for i in range(0, self._k):
-            root += self.fors_treehash(secret_seed, i * self._t, self._a, public_seed, adrs)
+            root += self.fors_treehash(i * self._t, self._a, ctx, adrs)
 
         fors_pk_adrs.set_type(ADRS.FORS_ROOTS)
         fors_pk_adrs.set_key_pair_address(adrs.get_key_pair_address())
-        pk = hash(public_seed, fors_pk_adrs, root, self._n)
+        pk = ctx.hash(fors_pk_adrs, root)
         return pk
 
-    # Input: Bit string M, secret seed SK.seed, address ADRS, public seed PK.seed
-    # Output: FORS signature SIG_FORS
-    def fors_sign(self, m, secret_seed, public_seed, adrs):
-        m_int = int.from_bytes(m, 'big')
-        sig_fors = []
+    # Input: Key context CTX, tree number i, leaf index idx, address ADRS
+    # Output: FORS private key of leaf idx, AUTH path of leaf idx, root of the tree
+    def fors_tree(self, i, idx, ctx, adrs: ADRS):
+        """
+        Build FORS tree i once, keeping the revealed private key and the authentication path of leaf idx
+        :return: sk, auth, root
+        """
+        s = i * self._t
+        target = s + idx
+        auth = [bytes()] * self._a
+        sk = None
 
-        for i in range(0, self._k):
-            idx = (m_int >> (self._k - 1 - i) * self._a) % self._t
+        stack = []
 
+        for leaf in range(s, s + self._t):
             adrs.set_tree_height(0)
-            adrs.set_tree_index(i * self._t + idx)
-            sig_fors += [prf(secret_seed, adrs.copy(), self._n)]
+            adrs.set_tree_index(leaf)
+            leaf_sk = self.prf(ctx, adrs)
+            if leaf == target:
+                sk = leaf_sk
 
-            auth = []
+            node = ctx.hash(adrs, leaf_sk)
+            height = 0
+            index = leaf
 
-            for j in range(0, self._a):
-                s = math.floor(idx // 2 ** j)
-                if s % 2 == 1:  # XORING idx/ 2**j with 1
-                    s -= 1
-                else:
-                    s += 1
+            while True:
+                if height < self._a and index == (target >> height) ^ 1:
+                    auth[height] = node
 
-                auth += [self.fors_treehash(secret_seed, i * self._t + s * 2 ** j, j, public_seed, adrs.copy())]
+                if len(stack) == 0 or stack[len(stack) - 1][1] != height:
+                    break
 
+                height += 1
+                index = index // 2
+                adrs.set_tree_height(height)
+                adrs.set_tree_index(index)
+                node = ctx.hash(adrs, stack.pop()[0] + node)
+
+            stack.append((node, height))
+
+        return sk, auth, stack.pop()[0]
+
+    # Input: Bit string M, key context CTX, address ADRS
+    # Output: FORS signature SIG_FORS, FORS public key PK
+    def fors_sign(self, m, ctx, adrs):
+        m_int = int.from_bytes(m, 'big')
+        sig_fors = []
+        root = bytes()
+
+        for i in range(0, self._k):
+            idx = (m_int >> (self._k - 1 - i) * self._a) % self._t
+
+            sk, auth, node = self.fors_tree(i, idx, ctx, adrs.copy())
+            sig_fors += [sk]
             sig_fors += auth
+            root += node
+
+        fors_pk_adrs = adrs.copy()
+        fors_pk_adrs.set_type(ADRS.FORS_ROOTS)
+        fors_pk_adrs.set_key_pair_address(adrs.get_key_pair_address())
+        pk = ctx.hash(fors_pk_adrs, root)
 
-        return sig_fors
+        return sig_fors, pk
 
-    # Input: FORS signature SIG_FORS, (k lg t)-bit string M, public seed PK.seed, address ADRS
+    # Input: FORS signature SIG_FORS, (k lg t)-bit string M, key context CTX, address ADRS
     # Output: FORS public key
-    def fors_pk_from_sig(self, sig_fors, m, public_seed, adrs: ADRS):
+    def fors_pk_from_sig(self, sig_fors, m, ctx, adrs: ADRS):
         m_int = int.from_bytes(m, 'big')
 
         sigs = self.auths_from_sig_fors(sig_fors)
@@ -624,7 +1971,7 @@ class Sphincs():
             sk = sigs[i][0]
             adrs.set_tree_height(0)
             adrs.set_tree_index(i * self._t + idx)
-            node_0 = hash(public_seed, adrs.copy(), sk, self._n)
+            node_0 = ctx.hash(adrs, sk)
             node_1 = 0
 
             auth = sigs[i][1]
@@ -635,10 +1982,10 @@ class Sphincs():
 
                 if math.floor(idx / 2 ** j) % 2 == 0:
                     adrs.set_tree_index(adrs.get_tree_index() // 2)
-                    node_1 = hash(public_seed, adrs.copy(), node_0 + auth[j], self._n)
+                    node_1 = ctx.hash(adrs, node_0 + auth[j])
                 else:
                     adrs.set_tree_index((adrs.get_tree_index() - 1) // 2)
-                    node_1 = hash(public_seed, adrs.copy(), auth[j] + node_0, self._n)
+                    node_1 = ctx.hash(adrs, bytes(auth[j]) + node_0)
 
                 node_0 = node_1
 
@@ -648,7 +1995,7 @@ class Sphincs():
         fors_pk_adrs.set_type(ADRS.FORS_ROOTS)
         fors_pk_adrs.set_key_pair_address(adrs.get_key_pair_address())
 
-        pk = hash(public_seed, fors_pk_adrs, root, self._n)
+        pk = ctx.hash(fors_pk_adrs, root)
         return pk
 
     # SPHINCS IMPLEMENTATION
@@ -657,35 +2004,38 @@ class Sphincs():
     # Input: (none)
     # Output: SPHINCS+ key pair (SK,PK)
     def spx_keygen(self):
+        ctx = self.spx_keygen_context()
+        return [ctx.secret_seed, ctx.secret_prf, ctx.public_seed, ctx.public_root], [ctx.public_seed, ctx.public_root]
+
+    # Input: whether the top layer tree is kept in the context
+    # Output: key context of the new key pair
+    def spx_keygen_context(self, keep_top_tree=False, workers=None):
         secret_seed = os.urandom(self._n)
         secret_prf = os.urandom(self._n)
         public_seed = os.urandom(self._n)
 
-        public_root = self.ht_pk_gen(secret_seed, public_seed)
-
-        return [secret_seed, secret_prf, public_seed, public_root], [public_seed, public_root]
-
-    # Input: Message M, private key SK = (SK.seed, SK.prf, PK.seed, PK.root)
-    # Output: SPHINCS+ signature SIG
-    def spx_sign(self, m, secret_key):
-        adrs = ADRS()
-
-        secret_seed = secret_key[0]
-        secret_prf = secret_key[1]
-        public_seed = secret_key[2]
-        public_root = secret_key[3]
+        ctx = KeyContext(self._n, public_seed, bytes(), secret_seed, secret_prf, get_hash_suite(self._hash_suite))
+        if workers is not None and workers > 1:
+            with self.worker_pool(ctx, workers) as pool:
+                ctx.public_root, levels = self.parallel_subtree(pool, workers, ctx, self._d - 1, 0, keep_top_tree)
+            if keep_top_tree:
+                ctx.top_tree = levels
+                ctx.top_tree_params = self.tree_params()
+        elif keep_top_tree:
+            ctx.public_root = self.build_top_tree(ctx)
+        else:
+            ctx.public_root = self.ht_pk_gen(ctx)
 
-        opt = bytes(self._n)
-        if self._randomize:
-            opt = os.urandom(self._n)
-        r = prf_msg(secret_prf, opt, m, self._n)
-        sig = [r]
+        return ctx
 
+    # Input: key context CTX, randomizer R, Message M
+    # Output: (k lg t)-bit message digest MD, tree index idx_tree, leaf index idx_leaf
+    def message_digest(self, ctx, r, m: MessageSource):
         size_md = math.floor((self._k * self._a + 7) / 8)
         size_idx_tree = math.floor((self._h - self._h // self._d + 7) / 8)
         size_idx_leaf = math.floor((self._h // self._d + 7) / 8)
 
-        digest = hash_msg(r, public_seed, public_root, m, size_md + size_idx_tree + size_idx_leaf)
+        digest = self.hash_msg(ctx, r, m, size_md + size_idx_tree + size_idx_leaf)
         tmp_md = digest[:size_md]
         tmp_idx_tree = digest[size_md:(size_md + size_idx_tree)]
         tmp_idx_leaf = digest[(size_md + size_idx_tree):len(digest)]
@@ -696,54 +2046,250 @@ class Sphincs():
         idx_tree = int.from_bytes(tmp_idx_tree, 'big') >> (len(tmp_idx_tree) * 8 - (self._h - self._h // self._d))
         idx_leaf = int.from_bytes(tmp_idx_leaf, 'big') >> (len(tmp_idx_leaf) * 8 - (self._h // self._d))
 
+        return md, idx_tree, idx_leaf
+
+    # Input: Message M, key context CTX of private key SK
+    # Output: randomizer R, message digest MD, tree index idx_tree, leaf index idx_leaf
+    def randomized_digest(self, m: MessageSource, ctx):
+        opt = bytes(self._n)
+        if self._randomize:
+            opt = os.urandom(self._n)
+        r = self.prf_msg(ctx, opt, m)
+        md, idx_tree, idx_leaf = self.message_digest(ctx, r, m)
+        return r, md, idx_tree, idx_leaf
+
+    # Input: Message M, key context CTX of private key SK = (SK.seed, SK.prf, PK.seed, PK.root)
+    # Output: SPHINCS+ signature SIG
+    def spx_sign(self, m, ctx):
+        adrs = ADRS()
+        if not isinstance(m, MessageSource):
+            m = MessageSource(m)
+
+        r, md, idx_tree, idx_leaf = self.randomized_digest(m, ctx)
+        sig = self.new_signature()
+        sig.set_r(r)
+
+        if self._sign_workers is not None:
+            sig_fors, sig_ht = self.parallel_fors_ht_sign(md, ctx, idx_tree, idx_leaf)
+            sig.set_sig_fors(sig_fors)
+            sig.set_sig_ht(sig_ht)
+            return sig
+
         adrs.set_layer_address(0)
         adrs.set_tree_address(idx_tree)
         adrs.set_type(ADRS.FORS_TREE)
         adrs.set_key_pair_address(idx_leaf)
 
-        sig_fors = self.fors_sign(md, secret_seed, public_seed, adrs.copy())
-        sig += [sig_fors]
-
-        pk_fors = self.fors_pk_from_sig(sig_fors, md, public_seed, adrs.copy())
+        sig_fors, pk_fors = self.fors_sign(md, ctx, adrs.copy())
+        sig.set_sig_fors(sig_fors)
 
         adrs.set_type(ADRS.TREE)
-        sig_ht = self.ht_sign(pk_fors, secret_seed, public_seed, idx_tree, idx_leaf)
-        sig += [sig_ht]
+        sig_ht = self.ht_sign(pk_fors, ctx, idx_tree, idx_leaf)
+        sig.set_sig_ht(sig_ht)
 
         return sig
 
-    # Input: Message M, signature SIG, public key PK
-    # Output: Boolean
-    def spx_verify(self, m, sig, public_key):
-        adrs = ADRS()
-        r = sig[0]
-        sig_fors = sig[1]
-        sig_ht = sig[2]
+    # Input: (k lg t)-bit string M, key context CTX, tree index idx_tree, leaf index idx_leaf
+    # Output: FORS signature SIG_FORS, HT signature SIG_HT of its public key
+    def parallel_fors_ht_sign(self, m, ctx, idx_tree, idx_leaf):
+        """
+        Every FORS tree and the subtree of every layer are independent jobs of the signing pool. The WOTS+
+        signature of a layer needs the root of the layer below, they are made here once the roots are back.
+        Layers found in the XMSS signature cache, and subtrees found in the top tree of CTX, the node cache or the
+        node store, are taken here without a job. Subtrees built by the workers are kept in the node cache and
+        the node store, the WOTS+ chain tables are used by the signatures made here
+        """
+        with self.signing_pool(ctx) as pool:
+            m_int = int.from_bytes(m, 'big')
+
+            fors_jobs = []
+            for i in range(0, self._k):
+                idx = (m_int >> (self._k - 1 - i) * self._a) % self._t
+                fors_jobs.append(pool.submit(worker_fors_tree, idx_tree, idx_leaf, i, idx))
+
+            # Per layer: tree, leaf, cached XMSS signature and root (or None), root and AUTH path (or their job)
+            layers = []
+            tree, leaf = idx_tree, idx_leaf
+            for j in range(0, self._d):
+                adrs = ADRS()
+                adrs.set_layer_address(j)
+                adrs.set_tree_address(tree)
+
+                cached = None
+                if j > 0 and self._xmss_signature_cache is not None:
+                    cached = self._xmss_signature_cache.get((ctx.key_id, self._legacy_prf, j, tree, leaf))
+
+                path = None
+                if cached is None:
+                    levels = self.cached_subtree(ctx, adrs)
+                    if levels is not None:
+                        root, auth, _, _ = self.xmss_subtree_from_levels(None, leaf, ctx, adrs, levels)
+                        path = (root, auth, None)
+                    else:
+                        path = pool.submit(worker_subtree_auth, j, tree, leaf, self.keeps_subtree(ctx, adrs))
+
+                layers.append((tree, leaf, cached, path))
+                leaf = tree % 2 ** self._h_prime
+                tree = tree >> self._h_prime
+
+            sig_fors = []
+            root = bytes()
+            for job in fors_jobs:
+                sk, auth, node = job.result()
+                sig_fors += [sk]
+                sig_fors += auth
+                root += node
+
+            adrs = ADRS()
+            adrs.set_tree_address(idx_tree)
+            adrs.set_type(ADRS.FORS_ROOTS)
+            adrs.set_key_pair_address(idx_leaf)
+            node = ctx.hash(adrs, root)
 
-        public_seed = public_key[0]
-        public_root = public_key[1]
+            sig_ht = []
+            for j, (tree, leaf, cached, path) in enumerate(layers):
+                if cached is not None:
+                    sig_ht += cached[0]
+                    node = cached[1]
+                    continue
 
-        size_md = math.floor((self._k * self._a + 7) / 8)
-        size_idx_tree = math.floor((self._h - self._h // self._d + 7) / 8)
-        size_idx_leaf = math.floor((self._h // self._d + 7) / 8)
+                root, auth, levels = path if isinstance(path, tuple) else path.result()
 
-        digest = hash_msg(r, public_seed, public_root, m, size_md + size_idx_tree + size_idx_leaf)
-        tmp_md = digest[:size_md]
-        tmp_idx_tree = digest[size_md:(size_md + size_idx_tree)]
-        tmp_idx_leaf = digest[(size_md + size_idx_tree):len(digest)]
+                adrs.set_layer_address(j)
+                adrs.set_tree_address(tree)
+                if levels is not None:
+                    self.keep_subtree(ctx, adrs, levels)
 
-        md_int = int.from_bytes(tmp_md, 'big') >> (len(tmp_md) * 8 - self._k * self._a)
-        md = md_int.to_bytes(math.ceil(self._k * self._a / 8), 'big')
+                adrs.set_type(ADRS.WOTS_HASH)
+                adrs.set_key_pair_address(leaf)
+                sig_xmss = self.wots_sign(node, ctx, adrs) + auth
+                sig_ht += sig_xmss
 
-        idx_tree = int.from_bytes(tmp_idx_tree, 'big') >> (len(tmp_idx_tree) * 8 - (self._h - self._h // self._d))
-        idx_leaf = int.from_bytes(tmp_idx_leaf, 'big') >> (len(tmp_idx_leaf) * 8 - (self._h // self._d))
+                if j > 0 and self._xmss_signature_cache is not None:
+                    self._xmss_signature_cache.put((ctx.key_id, self._legacy_prf, j, tree, leaf), (sig_xmss, root),
+                                                   self.xmss_signature_entry_size())
+
+                node = root
+
+            return sig_fors, sig_ht
+
+    # Input: key context CTX
+    # Output: process pool of parallel signing holding the key of CTX, kept running until the end of the block
+    @contextmanager
+    def signing_pool(self, ctx):
+        """
+        The pool of the last key used is kept for the next signatures. A pool replaced by the one of another key is
+        shut down when the signatures of other threads still using it are done
+        """
+        settings = self.settings()
+        with self._pool_lock:
+            if self._sign_pool is not None and self._sign_pool[0] == ctx.key_id and self._sign_pool[2] == settings:
+                pool = self._sign_pool[1]
+            else:
+                if self._sign_pool is not None:
+                    self.release_signing_pool(self._sign_pool[1])
+                pool = self.worker_pool(ctx, self._sign_workers)
+                self._sign_pool = (ctx.key_id, pool, settings)
+                self._pool_users[pool] = 1
+            self._pool_users[pool] += 1
+        try:
+            yield pool
+        finally:
+            with self._pool_lock:
+                self.release_signing_pool(pool)
+
+    # Input: process pool of parallel signing, the pool lock being held
+    # Output: None, the pool is shut down when neither this instance nor a signature uses it anymore
+    def release_signing_pool(self, pool):
+        self._pool_users[pool] -= 1
+        if self._pool_users[pool] == 0:
+            del self._pool_users[pool]
+            pool.shutdown()
+
+    # Input: Message M, Signature SIG, key context CTX of public key PK = (PK.seed, PK.root)
+    # Output: Boolean
+    def spx_verify(self, m, sig, ctx):
+        adrs = ADRS()
+        if not isinstance(m, MessageSource):
+            m = MessageSource(m)
+        r = sig.get_r()
+        sig_fors = sig.get_sig_fors()
+        sig_ht = sig.get_sig_ht()
+
+        md, idx_tree, idx_leaf = self.message_digest(ctx, r, m)
 
         adrs.set_layer_address(0)
         adrs.set_tree_address(idx_tree)
         adrs.set_type(ADRS.FORS_TREE)
         adrs.set_key_pair_address(idx_leaf)
 
-        pk_fors = self.fors_pk_from_sig(sig_fors, md, public_seed, adrs)
+        pk_fors = self.fors_pk_from_sig(sig_fors, md, ctx, adrs)
 
         adrs.set_type(ADRS.TREE)
-        return self.ht_verify(pk_fors, sig_ht, public_seed, idx_tree, idx_leaf, public_root)
+        return self.ht_verify(pk_fors, sig_ht, ctx, idx_tree, idx_leaf)
+
+
+# PROCESS POOL WORKERS
+# =================================================
+
+# Instance and key context of a worker process, set once by its pool initializer
+worker = None
+
+
+def init_worker(settings, key):
+    global worker
+    sphincs = Sphincs()
+    sphincs.apply_settings(settings)
+    if key is None:
+        worker = (sphincs, None)
+        return
+
+    secret_seed, secret_prf, public_seed, public_root = key
+    worker = (sphincs, KeyContext(sphincs.get_security(), public_seed, public_root, secret_seed, secret_prf,
+                                  get_hash_suite(sphincs.get_hash_suite())))
+
+
+# Input: layer address, tree address, first leaf, height of the part, whether its nodes are returned
+# Output: root of the part of the subtree, its nodes concatenated by height (or None)
+def worker_subtree_part(layer, tree, start, part_height, keep_nodes):
+    sphincs, ctx = worker
+    adrs = ADRS()
+    adrs.set_layer_address(layer)
+    adrs.set_tree_address(tree)
+
+    root, _, _, nodes = sphincs.xmss_traverse(None, start, ctx, adrs, start, part_height, keep_nodes)
+    if nodes is not None:
+        nodes = [b''.join(level) for level in nodes]
+    return root, nodes
+
+
+# Input: tree index idx_tree, leaf index idx_leaf, FORS tree i, index idx of its revealed leaf
+# Output: sk, auth, root of FORS tree i
+def worker_fors_tree(idx_tree, idx_leaf, i, idx):
+    sphincs, ctx = worker
+    adrs = ADRS()
+    adrs.set_tree_address(idx_tree)
+    adrs.set_type(ADRS.FORS_TREE)
+    adrs.set_key_pair_address(idx_leaf)
+
+    return sphincs.fors_tree(i, idx, ctx, adrs)
+
+
+# Input: layer address, tree address, leaf index, Boolean to return the nodes
+# Output: root of the subtree, AUTH path of the leaf, nodes of the subtree concatenated by height (or None)
+def worker_subtree_auth(layer, tree, leaf, keep_nodes=False):
+    sphincs, ctx = worker
+    adrs = ADRS()
+    adrs.set_layer_address(layer)
+    adrs.set_tree_address(tree)
+
+    root, auth, _, nodes = sphincs.xmss_subtree(None, leaf, ctx, adrs, keep_nodes)
+    levels = tuple(b''.join(level) for level in nodes) if keep_nodes else None
+    return root, auth, levels
+
+
+# Input: list of (message, signature, public key) triples
+# Output: list of Booleans
+def worker_verify_chunk(chunk):
+    sphincs, _ = worker
+    return [sphincs.verify(m, sig, pk) for m, sig, pk in chunk]
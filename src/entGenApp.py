@@ -16,6 +16,7 @@ import secrets
 from tkinter import simpledialog
 from tkinter import messagebox
 from package.sphincs import Sphincs  # Importar la clase Sphincs
+from package.migrate_key import PRF_FIELD, PRF_LEGACY, prf_name
 from dilithium_py.ml_dsa import ML_DSA_65  # Utilizamos Dilithium3 
 
 import sys
@@ -29,6 +30,7 @@ else:
 
 SK_ENTIDAD_PATH = os.path.join(BASE_DIR, "sk_entidad.json")
 PK_ENTIDAD_PATH = os.path.join(BASE_DIR, "pk_entidad.json")
+NODES_ENTIDAD_PATH = os.path.join(BASE_DIR, "sk_entidad.nodes")
 
 
 sphincs_instancia = Sphincs()
@@ -44,6 +46,7 @@ sphincs_instancia = Sphincs()
     # Preparar datos para guardar
     sk_data = {
         "sphincs_sk": sphincs_sk.hex(),
+        PRF_FIELD: prf_name(sphincs_instancia.get_legacy_prf()),
         "dilithium_sk": dilithium_sk.hex()
     }
     
@@ -90,11 +93,37 @@ def leer_claves_entidad():
         print(f"Error al leer claves: {e}")
         return None, None, None, None
 
+def leer_prf_entidad(sphincs_sk):
+    """
+    Indica si la clave SPHINCS de la entidad se generó con el PRF antiguo (Mersenne Twister).
+    Se toma del campo "sphincs_prf" del archivo de la clave; las claves guardadas sin él se comprueban
+    reconstruyendo su árbol superior (python -m package.migrate_key sk_entidad.json añade el campo).
+    """
+    with open(SK_ENTIDAD_PATH, "r") as sk_file:
+        prf = json.load(sk_file).get(PRF_FIELD)
+    if prf is not None:
+        return prf == PRF_LEGACY
+    return sphincs_instancia.detect_legacy_prf(sphincs_sk)
+
 # Intentar leer claves existentes
 ENTIDAD_SK_SPHINCS, ENTIDAD_PK_SPHINCS, ENTIDAD_SK_DILITHIUM, ENTIDAD_PK_DILITHIUM = leer_claves_entidad()
 # Para mantener compatibilidad con el código existente
 ENTIDAD_SK, ENTIDAD_PK = ENTIDAD_SK_SPHINCS, ENTIDAD_PK_SPHINCS
 
+# Firmar con el PRF con el que se generó la clave, con el otro las firmas no serían válidas
+if ENTIDAD_SK_SPHINCS is not None:
+    try:
+        sphincs_instancia.set_legacy_prf(leer_prf_entidad(ENTIDAD_SK_SPHINCS))
+    except (OSError, ValueError) as e:
+        print(f"Error al determinar el PRF de la clave de la entidad: {e}")
+
+# Nodos de las capas superiores del hiperárbol guardados junto a la clave, los reinicios no los recalculan
+if ENTIDAD_PK_SPHINCS is not None:
+    try:
+        sphincs_instancia.open_node_store(NODES_ENTIDAD_PATH, ENTIDAD_PK_SPHINCS)
+    except (OSError, ValueError) as e:
+        print(f"Error al abrir el almacén de nodos: {e}")
+
 class CertificadoDigitalApp:
     def __init__(self, root):
         self.root = root
@@ -104,6 +133,8 @@ class CertificadoDigitalApp:
 
         # Instancia de Sphincs
         self.sphincs = sphincs_instancia
+        # Las claves nuevas de los usuarios se generan con el PRF basado en hash, sea cual sea el de la entidad
+        self.sphincs_usuarios = Sphincs()
 
         # Título
         self.title_label = tk.Label(
@@ -312,7 +343,7 @@ class CertificadoDigitalApp:
             # Generar clave privada y pública del usuario según el algoritmo seleccionado
             if algoritmo == "Sphincs":
                 # Para certificados SPHINCS+, usar el algoritmo SPHINCS+
-                user_sk, user_pk = self.sphincs.generate_key_pair()
+                user_sk, user_pk = self.sphincs_usuarios.generate_key_pair()
             else:  # Dilithium
                 # Para certificados Dilithium, usar el algoritmo Dilithium
                 user_pk_raw, user_sk_raw = ML_DSA_65.keygen()  # Nota el orden invertido en Dilithium
@@ -365,6 +396,9 @@ class CertificadoDigitalApp:
             # Crear certificado de firma (incluye la clave privada del usuario)
             certificado_firma = certificado_autenticacion.copy()
             certificado_firma["user_secret_key"] = user_sk_encrypted  # Solo en el certificado de firma
+            if algoritmo == "Sphincs":
+                # PRF de la clave del usuario, AutoFirma lo selecciona al firmar
+                certificado_firma[PRF_FIELD] = prf_name(self.sphincs_usuarios.get_legacy_prf())
 
             # Calcular huella digital (hash de todo el certificado de firma)
             certificado_firma["huella_digital"] = self.calcular_hash(certificado_firma)
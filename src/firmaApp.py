@@ -8,6 +8,7 @@ sys.path.insert(0, parent_dir)
 
 import json
 import hashlib
+import multiprocessing
 import tkinter as tk
 from Crypto.Cipher import AES
 import base64
@@ -15,6 +16,7 @@ from tkinter import messagebox, filedialog, simpledialog
 from datetime import datetime
 import fitz  # PyMuPDF para manejar metadatos en PDFs
 from package.sphincs import Sphincs  # Importar la clase Sphincs
+from package.migrate_key import PRF_FIELD, PRF_LEGACY
 from dilithium_py.ml_dsa import ML_DSA_65  # Usamos ML_DSA_65 (Dilithium3)
 
 
@@ -27,6 +29,13 @@ class AutoFirmaApp:
 
         # Instancia de Sphincs
         self.sphincs = Sphincs()
+        # Las raíces ya autenticadas de la clave de la entidad acortan las verificaciones siguientes
+        self.sphincs.set_verified_root_cache(1024 * 1024)
+        # PRF detectado de las claves cuyos certificados no lo guardan, por huella de la clave
+        self.prf_claves = {}
+        # Los árboles FORS y las capas del hiperárbol de cada firma se calculan en paralelo
+        if (os.cpu_count() or 1) > 1:
+            self.sphincs.set_parallel_signing(os.cpu_count())
 
         # Título
         self.title_label = tk.Label(
@@ -179,6 +188,21 @@ class AutoFirmaApp:
             self.log_message(f"Error al verificar certificado: {e}")
             return False
         
+    def prf_antiguo(self, user_sk, cert_data):
+        """
+        Indica si la clave del usuario se generó con el PRF antiguo (Mersenne Twister).
+        Se toma del certificado; para los certificados que no lo guardan se comprueba la clave una vez.
+        """
+        prf = cert_data.get(PRF_FIELD)
+        if prf is not None:
+            return prf == PRF_LEGACY
+
+        huella_clave = hashlib.sha256(user_sk).digest()
+        if huella_clave not in self.prf_claves:
+            self.log_message("El certificado no indica el PRF de la clave, comprobándolo...")
+            self.prf_claves[huella_clave] = self.sphincs.detect_legacy_prf(user_sk)
+        return self.prf_claves[huella_clave]
+
     def decrypt_private_key(self, encrypted_sk, password):
         """Descifra la clave privada utilizando AES-256 CBC y verifica la redundancia."""
         try:
@@ -704,7 +728,8 @@ class AutoFirmaApp:
 
             # FIRMAR EL HASH DIGITALMENTE SEGÚN EL ALGORITMO
             if algoritmo == "sphincs":
-                # Firmar con SPHINCS+
+                # Firmar con SPHINCS+, con el PRF con el que se generó la clave
+                self.sphincs.set_legacy_prf(self.prf_antiguo(user_sk, cert_firma))
                 signature = self.sphincs.sign(hash_documento, user_sk)
             elif algoritmo == "dilithium":
                 # Firmar con Dilithium (orden diferente de parámetros)
@@ -786,6 +811,8 @@ class AutoFirmaApp:
 
 
 if __name__ == "__main__":
+    # El ejecutable de PyInstaller arranca los procesos de la firma en paralelo, deben ejecutar su tarea y no la app
+    multiprocessing.freeze_support()
     root = tk.Tk()
     app = AutoFirmaApp(root)
     root.mainloop()
@@ -6,12 +6,12 @@ from src.parameters import *
 from src.tweakables import *
 from src.adrs import *
 
-# Input: secret seed SK.seed, address ADRS, secret key index idx = it+j
+# Input: secret seed SK.seed, public seed PK.seed, address ADRS, secret key index idx = it+j
 # Output: FORS private key sk
-def fors_sk_gen(secret_seed, adrs: ADRS, idx):
+def fors_sk_gen(secret_seed, public_seed, adrs: ADRS, idx):
     adrs.set_tree_height(0)
     adrs.set_tree_index(idx)
-    sk = prf(secret_seed, adrs.copy())
+    sk = prf(public_seed, secret_seed, adrs)
 
     return sk
 
@@ -27,15 +27,15 @@ def fors_treehash(secret_seed, s, z, public_seed, adrs):
     for i in range(0, 2**z):
         adrs.set_tree_height(0)
         adrs.set_tree_index(s + i)
-        sk = prf(secret_seed, adrs.copy())
-        node = hash(public_seed, adrs.copy(), sk, n)
+        sk = prf(public_seed, secret_seed, adrs)
+        node = hash(public_seed, adrs, sk, n)
 
         adrs.set_tree_height(1)
         adrs.set_tree_index(s + i)
         if len(stack) > 0:
             while stack[len(stack) - 1]['height'] == adrs.get_tree_height():
                 adrs.set_tree_index((adrs.get_tree_index() - 1) // 2)
-                node = hash(public_seed, adrs.copy(), stack.pop()['node'] + node, n)
+                node = hash(public_seed, adrs, stack.pop()['node'] + node, n)
 
                 adrs.set_tree_height(adrs.get_tree_height() + 1)
 
@@ -61,33 +61,66 @@ def fors_pk_gen(secret_seed, public_seed, adrs: ADRS):
     return pk
 
 
+# Input: Secret seed SK.seed, tree number i, leaf index idx, public seed PK.seed, address ADRS
+# Output: FORS private key of leaf idx, AUTH path of leaf idx, root of the tree
+def fors_tree(secret_seed, i, idx, public_seed, adrs: ADRS):
+    s = i * t
+    target = s + idx
+    auth = [bytes()] * a
+    sk = None
+
+    stack = []
+
+    for leaf in range(s, s + t):
+        adrs.set_tree_height(0)
+        adrs.set_tree_index(leaf)
+        leaf_sk = prf(public_seed, secret_seed, adrs)
+        if leaf == target:
+            sk = leaf_sk
+
+        node = hash(public_seed, adrs, leaf_sk, n)
+        height = 0
+        index = leaf
+
+        while True:
+            if height < a and index == (target >> height) ^ 1:
+                auth[height] = node
+
+            if len(stack) == 0 or stack[len(stack) - 1][1] != height:
+                break
+
+            height += 1
+            index = index // 2
+            adrs.set_tree_height(height)
+            adrs.set_tree_index(index)
+            node = hash(public_seed, adrs, stack.pop()[0] + node, n)
+
+        stack.append((node, height))
+
+    return sk, auth, stack.pop()[0]
+
+
 # Input: Bit string M, secret seed SK.seed, address ADRS, public seed PK.seed
-# Output: FORS signature SIG_FORS
+# Output: FORS signature SIG_FORS, FORS public key PK
 def fors_sign(m, secret_seed, public_seed, adrs):
     m_int = int.from_bytes(m, 'big')
     sig_fors = []
+    root = bytes()
 
     for i in range(0, k):
         idx = (m_int >> (k - 1 - i) * a) % t
 
-        adrs.set_tree_height(0)
-        adrs.set_tree_index(i * t + idx)
-        sig_fors += [prf(secret_seed, adrs.copy())]
-
-        auth = []
-
-        for j in range(0, a):
-            s = math.floor(idx // 2 ** j)
-            if s % 2 == 1:  # XORING idx/ 2**j with 1
-                s -= 1
-            else:
-                s += 1
-
-            auth += [fors_treehash(secret_seed, i * t + s * 2**j, j, public_seed, adrs.copy())]
-
+        sk, auth, node = fors_tree(secret_seed, i, idx, public_seed, adrs.copy())
+        sig_fors += [sk]
         sig_fors += auth
+        root += node
+
+    fors_pk_adrs = adrs.copy()
+    fors_pk_adrs.set_type(ADRS.FORS_ROOTS)
+    fors_pk_adrs.set_key_pair_address(adrs.get_key_pair_address())
+    pk = hash(public_seed, fors_pk_adrs, root, n)
 
-    return sig_fors
+    return sig_fors, pk
 
 
 # Input: FORS signature SIG_FORS, (k lg t)-bit string M, public seed PK.seed, address ADRS
@@ -104,7 +137,7 @@ def fors_pk_from_sig(sig_fors, m, public_seed, adrs: ADRS):
         sk = sigs[i][0]
         adrs.set_tree_height(0)
         adrs.set_tree_index(i * t + idx)
-        node_0 = hash(public_seed, adrs.copy(), sk)
+        node_0 = hash(public_seed, adrs, sk)
         node_1 = 0
 
         auth = sigs[i][1]
@@ -115,10 +148,10 @@ def fors_pk_from_sig(sig_fors, m, public_seed, adrs: ADRS):
 
             if math.floor(idx / 2**j) % 2 == 0:
                 adrs.set_tree_index(adrs.get_tree_index() // 2)
-                node_1 = hash(public_seed, adrs.copy(), node_0 + auth[j], n)
+                node_1 = hash(public_seed, adrs, node_0 + auth[j], n)
             else:
                 adrs.set_tree_index((adrs.get_tree_index() - 1) // 2)
-                node_1 = hash(public_seed, adrs.copy(), auth[j] + node_0, n)
+                node_1 = hash(public_seed, adrs, auth[j] + node_0, n)
 
             node_0 = node_1
 
@@ -20,28 +20,30 @@ def ht_pk_gen(secret_seed, public_seed):
 # Input: Message M, private seed SK.seed, public seed PK.seed, tree index idx_tree, leaf index idx_leaf
 # Output: HT signature SIG_HT
 def ht_sign(m, secret_seed, public_seed, idx_tree, idx_leaf):
-    adrs = ADRS()
-    adrs.set_layer_address(0)
-    adrs.set_tree_address(idx_tree)
+    sig_ht, _ = ht_sign_with_roots(m, secret_seed, public_seed, idx_tree, idx_leaf)
+    return sig_ht
 
-    sig_tmp = xmss_sign(m, secret_seed, idx_leaf, public_seed, adrs.copy())
-    sig_ht = sig_tmp
-    root = xmss_pk_from_sig(idx_leaf, sig_tmp, m, public_seed, adrs.copy())
 
-    for j in range(1, d):
-        idx_leaf = idx_tree % 2**h_prime
-        idx_tree = idx_tree >> h_prime
+# Input: Message M, private seed SK.seed, public seed PK.seed, tree index idx_tree, leaf index idx_leaf
+# Output: HT signature SIG_HT, root of the XMSS subtree used on each layer (the last one is PK.root)
+def ht_sign_with_roots(m, secret_seed, public_seed, idx_tree, idx_leaf):
+    adrs = ADRS()
+    sig_ht = []
+    roots = []
 
+    for j in range(0, d):
         adrs.set_layer_address(j)
         adrs.set_tree_address(idx_tree)
 
-        sig_tmp = xmss_sign(root, secret_seed, idx_leaf, public_seed, adrs.copy())
-        sig_ht = sig_ht + sig_tmp
+        root, auth, sig, _ = xmss_subtree(m, secret_seed, idx_leaf, public_seed, adrs)
+        sig_ht += sig + auth
+        roots.append(root)
 
-        if j < d - 1:
-            root = xmss_pk_from_sig(idx_leaf, sig_tmp, root, public_seed, adrs.copy())
+        m = root
+        idx_leaf = idx_tree % 2**h_prime
+        idx_tree = idx_tree >> h_prime
 
-    return sig_ht
+    return sig_ht, roots
 
 
 # Input: Message M, signature SIG_HT, public seed PK.seed, tree index idx_tree, leaf index idx_leaf, HT public key PK_HT
@@ -7,6 +7,12 @@ import math
 # Randomness to signatures
 RANDOMIZE = True
 
+# Former Mersenne Twister PRF, only to sign with keys generated before hash-based PRF
+LEGACY_PRF = False
+
+# Instantiation of the hash functions, a name of package.hash_suites.HASH_SUITES
+HASH_SUITE = 'sha256'
+
 # Security parameter (in bytes)
 n = 32
 
@@ -65,11 +65,9 @@ def spx_sign(m, secret_key):
     adrs.set_type(ADRS.FORS_TREE)
     adrs.set_key_pair_address(idx_leaf)
 
-    sig_fors = fors_sign(md, secret_seed, public_seed, adrs.copy())
+    sig_fors, pk_fors = fors_sign(md, secret_seed, public_seed, adrs.copy())
     sig += [sig_fors]
 
-    pk_fors = fors_pk_from_sig(sig_fors, md, public_seed, adrs.copy())
-
     adrs.set_type(ADRS.TREE)
     sig_ht = ht_sign(pk_fors, secret_seed, public_seed, idx_tree, idx_leaf)
     sig += [sig_ht]
@@ -6,56 +6,42 @@ from src.utils import *
 from src.parameters import *
 from src.adrs import *
 import math
-import hashlib
 import random
+import functools
 
-
-def hash(seed, adrs: ADRS, value, digest_size=n):
-    m = hashlib.sha256()
-
-    m.update(seed)
-    m.update(adrs.to_bin())
-    m.update(value)
-
-    hashed = m.digest()[:digest_size]
-
-    return hashed
+from package.hash_suites import get_hash_suite
 
 
-def prf(secret_seed, adrs):
-    random.seed(int.from_bytes(secret_seed + adrs.to_bin(), "big"))
-    return random.randint(0, 256 ** n).to_bytes(n, byteorder='big')
+# Hash suite of HASH_SUITE bound to the given seeds, kept for the next calls made with the same key
+@functools.lru_cache(maxsize=8)
+def hash_suite(public_seed, secret_seed=None, secret_prf=None):
+    return get_hash_suite(HASH_SUITE)(n, public_seed, secret_seed, secret_prf)
 
 
-def hash_msg(r, public_seed, public_root, value, digest_size=n):
-    m = hashlib.sha256()
-
-    m.update(r)
-    m.update(public_seed)
-    m.update(public_root)
-    m.update(value)
+def hash(seed, adrs: ADRS, value, digest_size=n):
+    return hash_suite(seed).hash(adrs, value)[:digest_size]
 
-    hashed = m.digest()[:digest_size]
 
-    i = 0
-    while len(hashed) < digest_size:
-        i += 1
-        m = hashlib.sha256()
+def prf(public_seed, secret_seed, adrs):
+    if LEGACY_PRF:
+        # Generator of its own, the global one would be shared between threads
+        generator = random.Random(int.from_bytes(secret_seed + adrs.to_bin(), "big"))
+        return generator.randint(0, 256 ** n).to_bytes(n, byteorder='big')
 
-        m.update(r)
-        m.update(public_seed)
-        m.update(public_root)
-        m.update(value)
-        m.update(bytes([i]))
+    return hash_suite(public_seed, secret_seed).prf(adrs)
 
-        hashed += m.digest()[:digest_size - len(hashed)]
 
-    return hashed
+def hash_msg(r, public_seed, public_root, value, digest_size=n):
+    return hash_suite(public_seed).hash_msg(r, public_root, value, digest_size)
 
 
 def prf_msg(secret_seed, opt, m):
-    random.seed(int.from_bytes(secret_seed + opt + hash_msg(b'0', b'0', b'0', m, n*2), "big"))
-    return random.randint(0, 256 ** n).to_bytes(n, byteorder='big')
+    if LEGACY_PRF:
+        generator = random.Random(int.from_bytes(secret_seed + opt + hash_msg(b'0', b'0', b'0', m, n*2), "big"))
+        return generator.randint(0, 256 ** n).to_bytes(n, byteorder='big')
+
+    # PRF_msg does not depend on PK.seed
+    return hash_suite(bytes(n), secret_prf=secret_seed).prf_msg(opt, m)
 
 
 # Input: len_X-byte string X, int w, output length out_len
@@ -11,94 +11,117 @@ import math
 # Input: Input string X, start index i, number of steps s, public seed PK.seed, address ADRS
 # Output: value of F iterated s times on X
 def chain(x, i, s, public_seed, adrs: ADRS):
-    if s == 0:
-        return bytes(x)
-
     if (i + s) > (w - 1):
         return -1
 
-    tmp = chain(x, i, s - 1, public_seed, adrs)
-
-    adrs.set_hash_address(i + s - 1)
-    tmp = hash(public_seed, adrs, tmp, n)
+    tmp = bytes(x)
+    for j in range(i, i + s):
+        adrs.set_hash_address(j)
+        tmp = hash(public_seed, adrs, tmp, n)
 
     return tmp
 
 
-# Input: secret seed SK.seed, address ADRS
+# Input: Input strings X_c, start indexes, numbers of steps, public seed PK.seed, address ADRS
+# Output: buffer holding the end of every chain, values kept at the checkpoints of each chain
+def chains(xs, starts, steps, public_seed, adrs: ADRS, out=None, checkpoints=None):
+    if out is None:
+        out = bytearray(len(xs) * n)
+    kept = None if checkpoints is None else [{} for _ in range(0, len(xs))]
+
+    for c in range(0, len(xs)):
+        adrs.set_chain_address(c)
+        tmp = bytes(xs[c])
+        keep = None if checkpoints is None else checkpoints[c]
+
+        if keep is not None and starts[c] in keep:
+            kept[c][starts[c]] = tmp
+        for j in range(starts[c], starts[c] + steps[c]):
+            adrs.set_hash_address(j)
+            tmp = hash(public_seed, adrs, tmp, n)
+            if keep is not None and j + 1 in keep:
+                kept[c][j + 1] = tmp
+
+        out[c * n:(c + 1) * n] = tmp
+
+    return out, kept
+
+
+# Input: n-byte message M
+# Output: base w message with its checksum, one chain position for each chain
+def wots_msg(m):
+    csum = 0
+
+    msg = base_w(m, w, len_1)
+
+    for i in range(0, len_1):
+        csum += w - 1 - msg[i]
+
+    padding = (len_2 * math.floor(math.log(w, 2))) % 8 if (len_2 * math.floor(math.log(w, 2))) % 8 != 0 else 8
+    csum = csum << (8 - padding)
+    csumb = csum.to_bytes(math.ceil((len_2 * math.floor(math.log(w, 2))) / 8), byteorder='big')
+    csumw = base_w(csumb, w, len_2)
+    msg += csumw
+
+    return msg
+
+
+# Input: secret seed SK.seed, public seed PK.seed, address ADRS
 # Output: WOTS+ private key sk
-def wots_sk_gen(secret_seed, adrs: ADRS):  # Not necessary
+def wots_sk_gen(secret_seed, public_seed, adrs: ADRS):  # Not necessary
     sk = []
     for i in range(0, len_0):
         adrs.set_chain_address(i)
         adrs.set_hash_address(0)
-        sk.append(prf(secret_seed, adrs.copy()))
+        sk.append(prf(public_seed, secret_seed, adrs))
     return sk
 
 
 # Input: secret seed SK.seed, address ADRS, public seed PK.seed
 # Output: WOTS+ public key pk
 def wots_pk_gen(secret_seed, public_seed, adrs: ADRS):
+    pk, _ = wots_pk_and_sign(None, secret_seed, public_seed, adrs)
+    return pk
+
+
+# Input: Message M (or None), secret seed SK.seed, public seed PK.seed, address ADRS
+# Output: WOTS+ public key pk, WOTS+ signature sig of M read on the way up the chains (or None)
+def wots_pk_and_sign(m, secret_seed, public_seed, adrs: ADRS):
     wots_pk_adrs = adrs.copy()
-    tmp = bytes()
-    for i in range(0, len_0):
-        adrs.set_chain_address(i)
-        adrs.set_hash_address(0)
-        sk = prf(secret_seed, adrs.copy())
-        tmp += bytes(chain(sk, 0, w - 1, public_seed, adrs.copy()))
+    sk = wots_sk_gen(secret_seed, public_seed, adrs)
+
+    checkpoints = None
+    if m is not None:
+        checkpoints = [(pos,) for pos in wots_msg(m)]
+
+    tmp, kept = chains(sk, [0] * len_0, [w - 1] * len_0, public_seed, adrs, checkpoints=checkpoints)
 
     wots_pk_adrs.set_type(ADRS.WOTS_PK)
     wots_pk_adrs.set_key_pair_address(adrs.get_key_pair_address())
 
     pk = hash(public_seed, wots_pk_adrs, tmp)
-    return pk
+    sig = None if kept is None else [kept[i][checkpoints[i][0]] for i in range(0, len_0)]
+    return pk, sig
 
 
 # Input: Message M, secret seed SK.seed, public seed PK.seed, address ADRS
 # Output: WOTS+ signature sig
 def wots_sign(m, secret_seed, public_seed, adrs):
-    csum = 0
-
-    msg = base_w(m, w, len_1)
-
-    for i in range(0, len_1):
-        csum += w - 1 - msg[i]
+    msg = wots_msg(m)
+    sk = wots_sk_gen(secret_seed, public_seed, adrs)
 
-    padding = (len_2 * math.floor(math.log(w, 2))) % 8 if (len_2 * math.floor(math.log(w, 2))) % 8 != 0 else 8
-    csum = csum << (8 - padding)
-    csumb = csum.to_bytes(math.ceil((len_2 * math.floor(math.log(w, 2))) / 8), byteorder='big')
-    csumw = base_w(csumb, w, len_2)
-    msg += csumw
-
-    sig = []
-    for i in range(0, len_0):
-        adrs.set_chain_address(i)
-        adrs.set_hash_address(0)
-        sk = prf(secret_seed, adrs.copy())
-        sig += [chain(sk, 0, msg[i], public_seed, adrs.copy())]
+    tmp, _ = chains(sk, [0] * len_0, msg, public_seed, adrs)
 
+    sig = [bytes(tmp[i * n:(i + 1) * n]) for i in range(0, len_0)]
     return sig
 
 
 def wots_pk_from_sig(sig, m, public_seed, adrs: ADRS):
-    csum = 0
     wots_pk_adrs = adrs.copy()
 
-    msg = base_w(m, w, len_1)
-
-    for i in range(0, len_1):
-        csum += w - 1 - msg[i]
+    msg = wots_msg(m)
 
-    padding = (len_2 * math.floor(math.log(w, 2))) % 8 if (len_2 * math.floor(math.log(w, 2))) % 8 != 0 else 8
-    csum = csum << (8 - padding)
-    csumb = csum.to_bytes(math.ceil((len_2 * math.floor(math.log(w, 2))) / 8), byteorder='big')
-    csumw = base_w(csumb, w, len_2)
-    msg += csumw
-
-    tmp = bytes()
-    for i in range(0, len_0):
-        adrs.set_chain_address(i)
-        tmp += chain(sig[i], msg[i], w - 1 - msg[i], public_seed, adrs.copy())
+    tmp, _ = chains(sig, msg, [w - 1 - msg[i] for i in range(0, len_0)], public_seed, adrs)
 
     wots_pk_adrs.set_type(ADRS.WOTS_PK)
     wots_pk_adrs.set_key_pair_address(adrs.get_key_pair_address())
@@ -19,7 +19,7 @@ def treehash(secret_seed, s, z, public_seed, adrs: ADRS):
     for i in range(0, 2**z):
         adrs.set_type(ADRS.WOTS_HASH)
         adrs.set_key_pair_address(s + i)
-        node = wots_pk_gen(secret_seed, public_seed, adrs.copy())
+        node = wots_pk_gen(secret_seed, public_seed, adrs)
 
         adrs.set_type(ADRS.TREE)
         adrs.set_tree_height(1)
@@ -28,7 +28,7 @@ def treehash(secret_seed, s, z, public_seed, adrs: ADRS):
         if len(stack) > 0:
             while stack[len(stack) - 1]['height'] == adrs.get_tree_height():
                 adrs.set_tree_index((adrs.get_tree_index() - 1) // 2)
-                node = hash(public_seed, adrs.copy(), stack.pop()['node'] + node, n)
+                node = hash(public_seed, adrs, stack.pop()['node'] + node, n)
                 adrs.set_tree_height(adrs.get_tree_height() + 1)
 
                 if len(stack) <= 0:
@@ -46,23 +46,53 @@ def xmss_pk_gen(secret_seed, public_key, adrs: ADRS):
     return pk
 
 
-# Input: n-byte message M, secret seed SK.seed, index idx, public seed PK.seed, address ADRS
-# Output: XMSS signature SIG_XMSS = (sig || AUTH)
-def xmss_sign(m, secret_seed, idx, public_seed, adrs):
-    auth = []
-    for j in range(0, h_prime):
-        ki = math.floor(idx // 2**j)
-        if ki % 2 == 1: # XORING idx/ 2**j with 1
-            ki -= 1
+# Input: n-byte message M (or None), secret seed SK.seed, index idx, public seed PK.seed, address ADRS
+# Output: root node, AUTH path of leaf idx, WOTS+ signature of M with leaf idx, every node by height (or None)
+def xmss_subtree(m, secret_seed, idx, public_seed, adrs: ADRS, keep_nodes=False):
+    auth = [bytes()] * h_prime
+    nodes = [[] for _ in range(0, h_prime + 1)] if keep_nodes else None
+    sig = None
+
+    leaf_adrs = adrs.copy()
+    leaf_adrs.set_type(ADRS.WOTS_HASH)
+    node_adrs = adrs.copy()
+    node_adrs.set_type(ADRS.TREE)
+
+    stack = []
+
+    for i in range(0, 2**h_prime):
+        leaf_adrs.set_key_pair_address(i)
+        if i == idx and m is not None:
+            node, sig = wots_pk_and_sign(m, secret_seed, public_seed, leaf_adrs)
         else:
-            ki += 1
+            node = wots_pk_gen(secret_seed, public_seed, leaf_adrs)
+        height = 0
+        index = i
 
-        auth += [treehash(secret_seed, ki * 2**j, j, public_seed, adrs.copy())]
+        while True:
+            if nodes is not None:
+                nodes[height].append(node)
+            if height < h_prime and index == (idx >> height) ^ 1:
+                auth[height] = node
 
-    adrs.set_type(ADRS.WOTS_HASH)
-    adrs.set_key_pair_address(idx)
+            if len(stack) == 0 or stack[len(stack) - 1][1] != height:
+                break
+
+            height += 1
+            index = index // 2
+            node_adrs.set_tree_height(height)
+            node_adrs.set_tree_index(index)
+            node = hash(public_seed, node_adrs, stack.pop()[0] + node, n)
+
+        stack.append((node, height))
+
+    return stack.pop()[0], auth, sig, nodes
 
-    sig = wots_sign(m, secret_seed, public_seed, adrs.copy())
+
+# Input: n-byte message M, secret seed SK.seed, index idx, public seed PK.seed, address ADRS
+# Output: XMSS signature SIG_XMSS = (sig || AUTH)
+def xmss_sign(m, secret_seed, idx, public_seed, adrs):
+    root, auth, sig, _ = xmss_subtree(m, secret_seed, idx, public_seed, adrs)
     sig_xmss = sig + auth
     return sig_xmss
 
@@ -85,10 +115,10 @@ def xmss_pk_from_sig(idx, sig_xmss, m, public_seed, adrs):
 
         if math.floor(idx / 2**i) % 2 == 0:
             adrs.set_tree_index(adrs.get_tree_index() // 2)
-            node_1 = hash(public_seed, adrs.copy(), node_0 + auth[i], n)
+            node_1 = hash(public_seed, adrs, node_0 + auth[i], n)
         else:
             adrs.set_tree_index( (adrs.get_tree_index() - 1) // 2)
-            node_1 = hash(public_seed, adrs.copy(), auth[i] + node_0, n)
+            node_1 = hash(public_seed, adrs, auth[i] + node_0, n)
 
         node_0 = node_1
 
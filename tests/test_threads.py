@@ -0,0 +1,207 @@
+"""
+Signatures and verifications run by several threads on one shared Sphincs instance, compared byte for byte with the
+serial results while parameters and modes are changed in the middle
+"""
+
+import os
+import random
+import threading
+import time
+import unittest
+
+from package.adrs import ADRS
+from package.sphincs import Sphincs, prf_legacy, prf_msg_legacy
+
+THREADS = 4
+MESSAGES = [b'message %d' % i for i in range(24)]
+
+
+# Input: Legacy PRF mode
+# Output: Instance with small parameters and deterministic signatures
+def small_instance(legacy_prf):
+    sphincs = Sphincs()
+    sphincs.apply_settings(sphincs.settings()._replace(h=9, d=3, k=6, a=6, randomize=False, legacy_prf=legacy_prf))
+    return sphincs
+
+
+# Input: Instance, secret key, public key, messages, function run by the main thread while the others sign
+# Output: Signatures made by THREADS threads, each verified by the thread that made it
+def sign_in_threads(sphincs, sk, pk, messages, meanwhile=None):
+    signatures = {}
+    errors = []
+    start = threading.Barrier(THREADS + 1)
+
+    def run(part):
+        try:
+            start.wait()
+            for m in part:
+                signature = sphincs.sign(m, sk)
+                if not sphincs.verify(m, signature, pk):
+                    raise AssertionError("Invalid signature of %r" % m)
+                signatures[m] = signature
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(messages[i::THREADS],)) for i in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    if meanwhile is not None:
+        meanwhile()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return signatures
+
+
+class ThreadedSigningTest(unittest.TestCase):
+
+    def check(self, legacy_prf, configure=None, meanwhile=None):
+        sphincs = small_instance(legacy_prf)
+        sk, pk = sphincs.generate_key_pair()
+        serial = {m: sphincs.sign(m, sk) for m in MESSAGES}
+        if configure is not None:
+            configure(sphincs)
+        self.assertEqual(sign_in_threads(sphincs, sk, pk, MESSAGES, meanwhile and (lambda: meanwhile(sphincs))),
+                         serial)
+        return sphincs
+
+    def test_plain(self):
+        for legacy_prf in (False, True):
+            with self.subTest(legacy_prf=legacy_prf):
+                self.check(legacy_prf)
+
+    def test_caches(self):
+        def configure(sphincs):
+            sphincs.set_node_cache(1024 * 1024)
+            sphincs.set_xmss_signature_cache(1024 * 1024)
+            sphincs.set_verified_root_cache(1024 * 1024)
+
+        for legacy_prf in (False, True):
+            with self.subTest(legacy_prf=legacy_prf):
+                sphincs = self.check(legacy_prf, configure)
+                self.assertGreater(sphincs.get_node_cache_stats()['hits'], 0)
+
+    def test_changes_wait_for_operations(self):
+        # Every setter waits for the running signatures. The other parameters are set and restored within one
+        # change (nested setters join it), no signature can be made with them whatever the thread switches
+        def meanwhile(sphincs):
+            settings = sphincs.settings()
+            for _ in range(3):
+                with sphincs._guard.change():
+                    sphincs.set_h(12)
+                    sphincs.set_legacy_prf(not settings.legacy_prf)
+                    time.sleep(0.01)
+                    sphincs.apply_settings(settings)
+                sphincs.set_node_cache(1024 * 1024)
+                sphincs.set_xmss_signature_cache(64 * 1024)
+                sphincs.set_node_cache(None)
+                sphincs.set_xmss_signature_cache(None)
+
+        for legacy_prf in (False, True):
+            with self.subTest(legacy_prf=legacy_prf):
+                self.check(legacy_prf, meanwhile=meanwhile)
+
+    def test_changes_not_starved(self):
+        # Signatures keep coming, the setter still gets its turn between them
+        sphincs = small_instance(False)
+        sk, pk = sphincs.generate_key_pair()
+        stop = threading.Event()
+
+        def run():
+            while not stop.is_set():
+                sphincs.sign(MESSAGES[0], sk)
+
+        signers = [threading.Thread(target=run) for _ in range(THREADS)]
+        for thread in signers:
+            thread.start()
+        try:
+            setter = threading.Thread(target=sphincs.set_node_cache, args=(1024 * 1024,))
+            setter.start()
+            setter.join(60)
+            self.assertFalse(setter.is_alive())
+        finally:
+            stop.set()
+            for thread in signers:
+                thread.join()
+        self.assertIsNotNone(sphincs.get_node_cache())
+
+    def test_sign_many(self):
+        sphincs = small_instance(False)
+        sk, pk = sphincs.generate_key_pair()
+        serial = [sphincs.sign(m, sk) for m in MESSAGES]
+        results = [None] * THREADS
+        threads = [threading.Thread(target=lambda i=i: results.__setitem__(i, sphincs.sign_many(MESSAGES, sk)))
+                   for i in range(THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [serial] * THREADS)
+
+    def test_parallel_signing_two_keys(self):
+        # Threads signing with different keys replace the pool of each other, a pool in use stays up
+        sphincs = small_instance(False)
+        keys = [sphincs.generate_key_pair() for _ in range(2)]
+        messages = MESSAGES[:8]
+        serial = [{m: sphincs.sign(m, sk) for m in messages} for sk, _ in keys]
+        sphincs.set_parallel_signing(2)
+        try:
+            results = [{} for _ in range(THREADS)]
+            errors = []
+
+            def run(i):
+                sk, pk = keys[i % 2]
+                try:
+                    for m in messages:
+                        results[i][m] = sphincs.sign(m, sk)
+                except Exception as e:
+                    errors.append(e)
+
+            threads = [threading.Thread(target=run, args=(i,)) for i in range(THREADS)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            if errors:
+                raise errors[0]
+        finally:
+            sphincs.set_parallel_signing(None)
+        self.assertEqual(results, [serial[i % 2] for i in range(THREADS)])
+        self.assertEqual(sphincs._pool_users, {})
+
+    def test_setter_in_operation(self):
+        sphincs = small_instance(False)
+        with sphincs._guard.operation():
+            with self.assertRaises(RuntimeError):
+                sphincs.set_parallel_signing(None)
+
+
+class ParametersTest(unittest.TestCase):
+
+    def test_settings_round_trip(self):
+        sphincs = small_instance(True)
+        self.assertEqual(Sphincs(sphincs.settings()).settings(), sphincs.settings())
+
+    def test_legacy_prf_matches_global_seed(self):
+        # The legacy PRFs give the values of the former prf and prf_msg, seeding the global random module
+        state = random.getstate()
+        try:
+            for i in range(32):
+                seed, opt, m_digest = os.urandom(16), os.urandom(16), os.urandom(32)
+                adrs = ADRS()
+                adrs.set_tree_address(i)
+                adrs.set_key_pair_address(i % 5)
+                random.seed(int.from_bytes(seed + adrs.to_bin(), "big"))
+                expected = random.randint(0, 256 ** 16 - 1).to_bytes(16, byteorder='big')
+                self.assertEqual(prf_legacy(seed, adrs, 16), expected)
+                random.seed(int.from_bytes(seed + opt + m_digest, "big"))
+                expected = random.randint(0, 256 ** 16 - 1).to_bytes(16, byteorder='big')
+                self.assertEqual(prf_msg_legacy(seed, opt, m_digest, 16), expected)
+        finally:
+            random.setstate(state)
+
+
+if __name__ == '__main__':
+    unittest.main()